@@ -4,6 +4,10 @@ from models import db, Student, CareerCounsellor, Administrator
 from config import Config
 from routes import register_blueprints
 from routes.auth import auth_bp
+from jobs import register_commands
+from gateway import register_gateway
+from outbox import init_outbox
+from fragments import init_templates
 import logging
 import sys
 import os
@@ -44,6 +48,11 @@ register_blueprints(app)
 app.register_blueprint(auth_bp)
 logger.debug("Blueprints registered successfully")
 
+register_commands(app)
+register_gateway(app)
+init_outbox(app)
+init_templates(app)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -0,0 +1,187 @@
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from flask import current_app
+from models import db, Appointment, AppointmentRequest, CounsellorSchedule
+
+# Appointment statuses that still occupy the counsellor's time.
+BOOKED_STATUSES = ('scheduled', 'rescheduled')
+
+
+# Default wording per SlotUnavailable reason; {day} is the requested date.
+SLOT_MESSAGES = {
+    'past': 'Cannot schedule appointments in the past',
+    'day_off': 'Counsellor is not available on {day:%A}s',
+    'outside_hours': "Selected time is outside the counsellor's working hours",
+    'booked': 'This time slot is already booked. Please choose another time.'
+}
+
+
+class SlotUnavailable(Exception):
+    """
+    Raised by check_slot. reason is one of 'past', 'day_off', 'outside_hours'
+    or 'booked'; message() words it for the user.
+    """
+
+    def __init__(self, reason, day=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.day = day
+
+    def message(self, **overrides):
+        """SLOT_MESSAGES[reason], unless the caller overrides that reason's wording."""
+        return overrides.get(self.reason, SLOT_MESSAGES[self.reason]).format(day=self.day)
+
+
+class IntervalIndex:
+    """
+    One counsellor's bookings on one day as (start, end, id), sorted by start.
+    max_end[i] is the latest end among the first i + 1 bookings, so a lookup
+    bisects to the last booking starting before the probe ends and walks back
+    only while an earlier booking could still reach the probe's start. For
+    non-overlapping bookings that is O(log n) per lookup.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in self.intervals]
+        self.max_end = list(accumulate((end for _, end, _ in self.intervals), max))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def conflict(self, start, end, exclude=None):
+        """The first booking intersecting [start, end) whose id is not exclude, or None."""
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] > start:
+            booking = self.intervals[i]
+            if booking[1] > start and booking[2] != exclude:
+                return booking
+            i -= 1
+        return None
+
+
+def appointment_duration():
+    return timedelta(minutes=current_app.config.get('APPOINTMENT_DURATION_MINUTES', 60))
+
+def end_of(start_time, duration=None):
+    return (datetime.combine(date.min, start_time) + (duration or appointment_duration())).time()
+
+def working_hours(counsellor_id):
+    """{'Monday': (start, end), ...} for the counsellor's weekly schedule."""
+    return {
+        schedule.day_of_week: (schedule.start_time, schedule.end_time)
+        for schedule in CounsellorSchedule.query.filter_by(counsellor_id=counsellor_id)
+    }
+
+def _load_bookings(counsellor_id, start, end):
+    """
+    {day: ([appointment], [request])} as (start_time, end_time, id) tuples for
+    days in [start, end]. Two queries for the whole range.
+    """
+    bookings = {}
+    appointments = db.session.query(
+        Appointment.appointment_date, Appointment.start_time, Appointment.end_time, Appointment.id
+    ).filter(
+        Appointment.counsellor_id == counsellor_id,
+        Appointment.appointment_date >= start,
+        Appointment.appointment_date <= end,
+        Appointment.status.in_(BOOKED_STATUSES)
+    )
+    for day, start_time, end_time, appointment_id in appointments:
+        bookings.setdefault(day, ([], []))[0].append((start_time, end_time or end_of(start_time), appointment_id))
+
+    requests = db.session.query(
+        AppointmentRequest.preferred_date, AppointmentRequest.preferred_time, AppointmentRequest.id
+    ).filter(
+        AppointmentRequest.counsellor_id == counsellor_id,
+        AppointmentRequest.preferred_date >= start,
+        AppointmentRequest.preferred_date <= end,
+        AppointmentRequest.status == 'pending'
+    )
+    for day, start_time, request_id in requests:
+        bookings.setdefault(day, ([], []))[1].append((start_time, end_of(start_time), request_id))
+    return bookings
+
+def day_indexes(counsellor_id, start, end):
+    """
+    {day: (appointments, requests)} IntervalIndex pairs for the days in
+    [start, end] that have bookings, built from two queries.
+    """
+    return {
+        day: (IntervalIndex(appointments), IntervalIndex(requests))
+        for day, (appointments, requests) in _load_bookings(counsellor_id, start, end).items()
+    }
+
+def free_slots(counsellor_id, start, end, duration=None, include_requests=True):
+    """
+    Every free start time for the counsellor on days in [start, end], as
+    {day: [time, ...]}. Slots are laid out back to back from the start of each
+    working day and skip past times, appointments and pending requests.
+    """
+    duration = duration or appointment_duration()
+    hours = working_hours(counsellor_id)
+    indexes = day_indexes(counsellor_id, start, end)
+    now = datetime.now()
+
+    slots = {}
+    day = start
+    while day <= end:
+        if day.strftime('%A') in hours:
+            day_start, day_end = hours[day.strftime('%A')]
+            appointments, requests = indexes.get(day, (IntervalIndex(), IntervalIndex()))
+            free = []
+            slot = datetime.combine(day, day_start)
+            closing = datetime.combine(day, day_end)
+            while slot + duration <= closing:
+                slot_start, slot_end = slot.time(), (slot + duration).time()
+                clash = appointments.conflict(slot_start, slot_end) or (
+                    include_requests and requests.conflict(slot_start, slot_end)
+                )
+                if slot > now and not clash:
+                    free.append(slot_start)
+                slot += duration
+            slots[day] = free
+        day += timedelta(days=1)
+    return slots
+
+def _booked_in_db(counsellor_id, day, start_time, end_time, duration, include_requests,
+                  exclude_appointment_id, exclude_request_id):
+    """Range-predicate lookup on the slot indexes, as one EXISTS query."""
+    appointments = db.session.query(Appointment.id).filter(
+        Appointment.overlapping(counsellor_id, day, start_time, end_time, duration),
+        Appointment.status.in_(BOOKED_STATUSES)
+    )
+    if exclude_appointment_id is not None:
+        appointments = appointments.filter(Appointment.id != exclude_appointment_id)
+    clash = appointments.exists()
+
+    if include_requests:
+        requests = db.session.query(AppointmentRequest.id).filter(
+            AppointmentRequest.overlapping(counsellor_id, day, start_time, end_time, duration),
+            AppointmentRequest.status == 'pending'
+        )
+        if exclude_request_id is not None:
+            requests = requests.filter(AppointmentRequest.id != exclude_request_id)
+        clash = db.or_(clash, requests.exists())
+    return db.session.query(clash).scalar()
+
+def check_slot(counsellor_id, day, start_time, duration=None, include_requests=False,
+               exclude_appointment_id=None, exclude_request_id=None):
+    """Raise SlotUnavailable unless [start_time, start_time + duration) on day is bookable."""
+    duration = duration or appointment_duration()
+    end_time = end_of(start_time, duration)
+    if day < datetime.now().date():
+        raise SlotUnavailable('past', day)
+
+    hours = working_hours(counsellor_id).get(day.strftime('%A'))
+    if hours is None:
+        raise SlotUnavailable('day_off', day)
+    if start_time < hours[0] or end_time > hours[1] or end_time <= start_time:
+        raise SlotUnavailable('outside_hours', day)
+
+    # Always asked of the tables: another worker may have booked or freed the slot.
+    if _booked_in_db(counsellor_id, day, start_time, end_time, duration, include_requests,
+                     exclude_appointment_id, exclude_request_id):
+        raise SlotUnavailable('booked', day)
+    return end_time
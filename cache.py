@@ -0,0 +1,116 @@
+import threading
+import time
+from types import SimpleNamespace
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache whose entries expire after ttl seconds.
+    Every delete/clear bumps a generation, so a value computed from data read
+    before an invalidation is not stored after it.
+    """
+
+    def __init__(self, ttl=300, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def generation(self, key):
+        """Token to take before computing a value and hand to set()."""
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key, value, ttl=None, generation=None):
+        """Store value, unless key was invalidated since generation was taken."""
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return False
+            if len(self._data) >= self.max_size:
+                self._evict()
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._generations) >= self.max_size:
+                self._reset_generations()
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._reset_generations()
+
+    def get_or_set(self, key, compute, ttl=None):
+        missing = object()
+        generation = self.generation(key)
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl, generation)
+        return value
+
+    def _reset_generations(self):
+        # A new epoch outdates every token handed out so far, per-key ones included.
+        self._generations.clear()
+        self._epoch += 1
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_size:
+            # Still full of live entries: drop the ones closest to expiry.
+            for key, _ in sorted(self._data.items(), key=lambda item: item[1][0])[:self.max_size // 10 or 1]:
+                del self._data[key]
+
+
+def snapshot(obj, exclude=(), **extra):
+    """
+    Copy the column values of an ORM object into a plain namespace that is
+    safe to cache and share between requests, unlike the session-bound object.
+    """
+    values = {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs if attr.key not in exclude}
+    values.update(extra)
+    return SimpleNamespace(**values)
+
+
+def invalidate_on_commit(session, cache, key=None):
+    """
+    Drop key (or the whole cache when key is None) once session commits, so
+    readers never cache a value the open transaction is about to change.
+    """
+    session.info.setdefault('cache_invalidations', set()).add((cache, key))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    for cache, key in session.info.pop('cache_invalidations', ()):
+        if key is None:
+            cache.clear()
+        else:
+            cache.delete(key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('cache_invalidations', None)
@@ -18,7 +18,9 @@ CREATE TABLE counsellors (
     rating DECIMAL(3, 2),
     date_registered DATETIME DEFAULT CURRENT_TIMESTAMP,
     last_login DATETIME DEFAULT NULL,
-    is_active BOOLEAN DEFAULT TRUE
+    is_active BOOLEAN DEFAULT TRUE,
+    INDEX ix_counsellors_name (first_name, last_name),
+    INDEX ix_counsellors_last_name (last_name)
 );
 
 CREATE TABLE student (
@@ -38,6 +40,8 @@ CREATE TABLE student (
     is_active BOOLEAN DEFAULT TRUE,
     date_registered DATETIME DEFAULT CURRENT_TIMESTAMP,
     last_login DATETIME DEFAULT NULL,
+    INDEX ix_student_name (first_name, last_name),
+    INDEX ix_student_last_name (last_name),
     FOREIGN KEY (counsellor_id) REFERENCES counsellors(id) ON DELETE SET NULL
 );
 
@@ -78,6 +82,7 @@ CREATE TABLE appointment_requests (
     status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX ix_appointment_requests_counsellor_slot (counsellor_id, preferred_date, status, preferred_time),
     FOREIGN KEY (student_id) REFERENCES student(id) ON DELETE CASCADE,
     FOREIGN KEY (counsellor_id) REFERENCES counsellors(id) ON DELETE CASCADE
 );
@@ -94,6 +99,7 @@ CREATE TABLE appointments (
     mode ENUM('online', 'offline', 'phone') NOT NULL,
     meeting_link VARCHAR(255),
     location VARCHAR(255),
+    INDEX ix_appointments_counsellor_slot (counsellor_id, appointment_date, start_time, end_time, status),
     FOREIGN KEY (student_id) REFERENCES student(id) ON DELETE CASCADE,
     FOREIGN KEY (counsellor_id) REFERENCES counsellors(id) ON DELETE CASCADE
 );
@@ -128,7 +134,25 @@ CREATE TABLE notifications (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     read_status BOOLEAN DEFAULT FALSE,
     notification_type ENUM('general', 'appointment', 'resource', 'payment', 'grievance', 'appointment_request', 'feedback', 'event') NOT NULL,
-    related_entity_id INT
+    related_entity_id INT,
+    collapsed_count INT,
+    INDEX ix_notifications_user_unread (user_type, user_id, read_status, created_at),
+    INDEX ix_notifications_user_feed (user_type, user_id, created_at, notification_id)
+);
+
+CREATE TABLE notification_outbox (
+    outbox_id INT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status ENUM('pending', 'processing', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    claim_token VARCHAR(36),
+    claimed_at DATETIME,
+    available_at DATETIME,
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    processed_at DATETIME,
+    INDEX ix_notification_outbox_status (status, outbox_id)
 );
 
 CREATE TABLE messages (
@@ -139,7 +163,37 @@ CREATE TABLE messages (
     recipient_type ENUM('student', 'counsellor') NOT NULL,
     message_text TEXT NOT NULL,
     sent_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    is_read BOOLEAN DEFAULT FALSE
+    is_read BOOLEAN DEFAULT FALSE,
+    INDEX ix_messages_conversation (sender_type, sender_id, recipient_type, recipient_id, sent_at, message_id),
+    INDEX ix_messages_sent_at (sent_at),
+    FULLTEXT INDEX ft_messages_text (message_text)
+);
+
+CREATE TABLE messages_archive (
+    message_id INT PRIMARY KEY,
+    sender_id INT NOT NULL,
+    recipient_id INT NOT NULL,
+    sender_type ENUM('student', 'counsellor') NOT NULL,
+    recipient_type ENUM('student', 'counsellor') NOT NULL,
+    message_text TEXT NOT NULL,
+    sent_at DATETIME,
+    is_read BOOLEAN DEFAULT FALSE,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_messages_archive_conversation (sender_type, sender_id, recipient_type, recipient_id, sent_at, message_id)
+);
+
+CREATE TABLE conversations (
+    student_id INT NOT NULL,
+    counsellor_id INT NOT NULL,
+    last_message_id INT,
+    student_unread INT NOT NULL DEFAULT 0,
+    counsellor_unread INT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    archived_at DATETIME,
+    PRIMARY KEY (student_id, counsellor_id),
+    INDEX ix_conversations_counsellor (counsellor_id, last_message_id),
+    FOREIGN KEY (student_id) REFERENCES student(id) ON DELETE CASCADE,
+    FOREIGN KEY (counsellor_id) REFERENCES counsellors(id) ON DELETE CASCADE
 );
 
 CREATE TABLE career_goals (
@@ -186,6 +240,7 @@ CREATE TABLE event_registrations (
     registered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     reminder_sent BOOLEAN DEFAULT FALSE,
     attendance_status ENUM('registered', 'attended', 'missed') DEFAULT 'registered',
+    INDEX ix_event_registrations_event_student (event_id, student_id),
     FOREIGN KEY (event_id) REFERENCES events(event_id) ON DELETE CASCADE,
     FOREIGN KEY (student_id) REFERENCES student(id) ON DELETE CASCADE
 );
@@ -204,6 +259,17 @@ CREATE TABLE tasks (
     FOREIGN KEY (student_id) REFERENCES student(id)
 );
 
+CREATE TABLE daily_rollups (
+    day DATE NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    dimension VARCHAR(50) NOT NULL DEFAULT 'all',
+    value_count INT NOT NULL DEFAULT 0,
+    value_sum DECIMAL(12, 2),
+    computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, metric, dimension),
+    INDEX ix_daily_rollups_metric_day (metric, day)
+);
+
 INSERT INTO counsellors (
     first_name, last_name, email, password_hash, specialization, qualification,
     years_of_experience, bio, availability_status, rating, date_registered, is_active
@@ -0,0 +1,51 @@
+import hashlib
+import os
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+from cache import TTLCache, snapshot
+
+fragment_cache = TTLCache(ttl=600)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache 'name', key, ... %}...{% endcache %} renders its body once per
+    distinct key tuple and serves the stored HTML until it expires. Keys must
+    include everything the body reads (user id, a data version), because the
+    body is not evaluated on a hit.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        if not fragment_cache.ttl:
+            return caller()
+        return fragment_cache.get_or_set(tuple(key), caller)
+
+
+def data_version(*collections):
+    """Digest of the column values of the given ORM objects, for use as a fragment key."""
+    digest = hashlib.sha1()
+    for items in collections:
+        for obj in items or ():
+            digest.update(repr(sorted(vars(snapshot(obj)).items())).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def init_templates(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    fragment_cache.ttl = app.config.get('FRAGMENT_CACHE_TTL', 600)
+
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
@@ -0,0 +1,178 @@
+import json
+import logging
+import queue
+import threading
+from flask import current_app
+from flask_login import current_user
+from models import db, Message, Student
+from realtime import message_hub, presence
+from routes.messages import CHAT_USER_TYPES, current_user_key, post_message
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
+    ConnectionClosed = None
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed onto a connection's queue to stop its writer thread.
+CLOSE = object()
+
+
+def load_contacts(user_type, user_id):
+    """The set of (user_type, user_id) pairs this user may message."""
+    if user_type == 'student':
+        counsellor_id = db.session.query(Student.counsellor_id).filter_by(id=user_id).scalar()
+        return {('counsellor', counsellor_id)} if counsellor_id else set()
+    return {('student', student_id) for (student_id,) in db.session.query(Student.id).filter_by(counsellor_id=user_id)}
+
+def publish_presence(user_type, user_id, contacts, online):
+    for contact_type, contact_id in contacts:
+        message_hub.publish(contact_type, contact_id, 'presence', {
+            'user_type': user_type,
+            'user_id': user_id,
+            'online': online
+        })
+
+def online_contacts(contacts):
+    online = []
+    for contact_type in ('student', 'counsellor'):
+        ids = [contact_id for t, contact_id in contacts if t == contact_type]
+        online.extend({'user_type': contact_type, 'user_id': contact_id}
+                      for contact_id in sorted(presence.online_among(contact_type, ids)))
+    return online
+
+def frame(event, data):
+    return json.dumps({'event': event, 'data': data})
+
+
+def chat_gateway(ws):
+    """
+    One WebSocket per browser tab carrying chat messages, read receipts,
+    typing and presence events. Everything the client should see goes through
+    the connection's hub queue and is written by a single writer thread.
+    """
+    if not current_user.is_authenticated or current_user_key()[0] not in CHAT_USER_TYPES:
+        ws.close(reason=1008, message='Login as a student or counsellor to chat')
+        return
+
+    user_type, user_id = current_user_key()
+    keepalive = current_app.config.get('MESSAGE_STREAM_KEEPALIVE', 15)
+
+    contacts = load_contacts(user_type, user_id)
+    db.session.close()
+
+    subscription = message_hub.subscribe(user_type, user_id)
+
+    def reply(event, data):
+        try:
+            subscription.put_nowait((event, data))
+        except queue.Full:
+            pass
+
+    def writer():
+        while True:
+            try:
+                item = subscription.get(timeout=keepalive)
+            except queue.Empty:
+                continue
+            if item is CLOSE:
+                return
+            try:
+                ws.send(frame(*item))
+            except ConnectionClosed:
+                return
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+
+    if presence.touch(user_type, user_id):
+        publish_presence(user_type, user_id, contacts, True)
+    reply('ready', {
+        'user_type': user_type,
+        'user_id': user_id,
+        'presence_ttl': presence.ttl,
+        'online': online_contacts(contacts)
+    })
+
+    try:
+        while True:
+            raw = ws.receive()
+            try:
+                data = json.loads(raw)
+                if not isinstance(data, dict):
+                    raise ValueError
+            except (TypeError, ValueError):
+                reply('error', {'error': 'Frames must be JSON objects'})
+                continue
+
+            kind = data.get('type')
+            if kind == 'ping':
+                if presence.touch(user_type, user_id):
+                    publish_presence(user_type, user_id, contacts, True)
+                reply('pong', {'online': online_contacts(contacts)})
+                continue
+
+            partner = (data.get('partner_type'), data.get('partner_id'))
+            if kind == 'send':
+                partner = (data.get('recipient_type'), data.get('recipient_id'))
+                if partner not in contacts:
+                    # Assignments change while a tab stays open, so re-check before rejecting.
+                    contacts = load_contacts(user_type, user_id)
+                if partner not in contacts:
+                    reply('error', {'error': 'You can only message your assigned contacts'})
+                elif not data.get('message'):
+                    reply('error', {'error': 'Message text is required'})
+                else:
+                    try:
+                        post_message(user_type, user_id, partner[0], partner[1], data.get('message'))
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f'Error sending message over websocket: {str(e)}')
+                        reply('error', {'error': 'Failed to send message'})
+                    finally:
+                        db.session.close()
+            elif partner not in contacts:
+                reply('error', {'error': 'You can only message your assigned contacts'})
+            elif kind == 'typing':
+                message_hub.publish(partner[0], partner[1], 'typing', {
+                    'user_type': user_type,
+                    'user_id': user_id,
+                    'typing': bool(data.get('typing', True))
+                })
+            elif kind == 'read':
+                up_to = data.get('up_to')
+                if not isinstance(up_to, int):
+                    reply('error', {'error': 'up_to must be the highest message id the client has seen'})
+                    continue
+                try:
+                    if Message.mark_conversation_read(user_type, user_id, partner[0], partner[1], up_to):
+                        db.session.commit()
+                        message_hub.publish_read(user_type, user_id, partner[0], partner[1], up_to)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f'Error marking messages read over websocket: {str(e)}')
+                    reply('error', {'error': 'Failed to mark conversation as read'})
+                finally:
+                    db.session.close()
+            else:
+                reply('error', {'error': f'Unknown frame type: {kind}'})
+    finally:
+        message_hub.unsubscribe(user_type, user_id, subscription)
+        try:
+            subscription.put_nowait(CLOSE)
+        except queue.Full:
+            pass
+        if not message_hub.subscriber_count(user_type, user_id):
+            presence.forget(user_type, user_id)
+            publish_presence(user_type, user_id, contacts, False)
+
+
+def register_gateway(app):
+    if Sock is None:
+        logger.warning('flask-sock is not installed; chat falls back to the SSE stream')
+        return
+    presence.ttl = app.config.get('PRESENCE_TTL', presence.ttl)
+    Sock(app).route('/ws/chat')(chat_gateway)
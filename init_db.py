@@ -1,5 +1,6 @@
 from app import app
-from models import db, CareerCounsellor, Administrator
+from jobs import upgrade_schema
+from models import db, CareerCounsellor, Administrator, Conversation
 from datetime import datetime
 
 
@@ -118,6 +119,9 @@ initial_counsellors = [
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        upgrade_schema()
         initialize_counsellors()
         init_db()
+        Conversation.rebuild()
+        db.session.commit()
         print("Database tables created and counsellors initialized!")
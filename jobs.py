@@ -0,0 +1,357 @@
+import click
+from flask import current_app
+from models import (
+    db, Message, MessageArchive, Conversation, Notification, NotificationOutbox, notification_states,
+    DailyRollup, Student, Appointment, Grievance, Event, EventRegistration, Feedback
+)
+from outbox import drain_outbox
+from search import ensure_search_index
+from cache import invalidate_on_commit
+from sqlalchemy import func, text
+from datetime import date, datetime, timedelta, timezone
+
+
+def archive_messages(max_age_days=None, batch_size=None):
+    """
+    Move messages older than max_age_days from the messages table into
+    messages_archive, one committed batch at a time. Archived messages are
+    stored as read. Returns the number of messages moved.
+    """
+    max_age_days = max_age_days or current_app.config.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180)
+    batch_size = batch_size or current_app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', 1000)
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    columns = ['message_id', 'sender_id', 'recipient_id', 'sender_type', 'recipient_type',
+               'message_text', 'sent_at', 'is_read']
+
+    moved = 0
+    while True:
+        ids = [row.message_id for row in db.session.query(Message.message_id).filter(
+            Message.sent_at < cutoff
+        ).order_by(Message.sent_at, Message.message_id).limit(batch_size)]
+        if not ids:
+            break
+
+        try:
+            Conversation.record_archive(ids)
+            db.session.execute(db.insert(MessageArchive).from_select(
+                columns,
+                db.select(*[
+                    db.literal(True).label(column) if column == 'is_read' else getattr(Message, column)
+                    for column in columns
+                ]).where(Message.message_id.in_(ids))
+            ))
+            Message.query.filter(Message.message_id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved += len(ids)
+
+    return moved
+
+
+def delete_in_batches(model, id_column, condition, batch_size):
+    """Delete rows matching condition, batch_size ids per committed transaction. Returns the number deleted."""
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.session.query(id_column).filter(condition).order_by(id_column).limit(batch_size)]
+        if not ids:
+            return deleted
+        try:
+            model.query.filter(id_column.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        deleted += len(ids)
+
+
+def collapse_notifications(cutoff, min_group_size, batch_size):
+    """
+    Replace every run of at least min_group_size read, same-type notifications a
+    user received before cutoff with one read summary row. Unread notifications
+    are left alone, so nothing the user has not seen disappears into a summary.
+    Summaries record how many notifications they stand for in collapsed_count,
+    so collapsing them again keeps the total, and keep related_entity_id when
+    every row in the group points at the same entity. Returns (rows removed,
+    summary rows written).
+    """
+    min_group_size = max(min_group_size, 2)
+    removed = summaries = 0
+    while True:
+        groups = db.session.query(
+            Notification.user_type,
+            Notification.user_id,
+            Notification.notification_type,
+            func.count(Notification.notification_id).label('row_count'),
+            func.sum(func.coalesce(Notification.collapsed_count, 1)).label('total'),
+            func.max(Notification.notification_id).label('max_id'),
+            func.max(Notification.created_at).label('latest'),
+            func.min(Notification.related_entity_id).label('first_entity_id'),
+            func.max(Notification.related_entity_id).label('last_entity_id')
+        ).filter(
+            Notification.read_status == True,
+            Notification.created_at < cutoff
+        ).group_by(
+            Notification.user_type,
+            Notification.user_id,
+            Notification.notification_type
+        ).having(
+            func.count(Notification.notification_id) >= min_group_size
+        ).limit(batch_size).all()
+        if not groups:
+            return removed, summaries
+
+        try:
+            for group in groups:
+                removed += Notification.query.filter(
+                    Notification.user_type == group.user_type,
+                    Notification.user_id == group.user_id,
+                    Notification.notification_type == group.notification_type,
+                    Notification.read_status == True,
+                    Notification.created_at < cutoff,
+                    Notification.notification_id <= group.max_id
+                ).delete(synchronize_session=False)
+            summaries += Notification.insert_many([{
+                'user_type': group.user_type,
+                'user_id': group.user_id,
+                'notification_type': group.notification_type,
+                'message': f"{group.total} earlier {group.notification_type.replace('_', ' ')} notifications were combined into this summary.",
+                'created_at': group.latest,
+                'read_status': True,
+                'related_entity_id': group.first_entity_id if group.first_entity_id == group.last_entity_id else None,
+                'collapsed_count': group.total
+            } for group in groups])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def local_to_utc(moment):
+    """Express a naive local-time datetime as the naive UTC datetime outbox columns hold."""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def compact_notifications(retention_days=None, collapse_after_days=None, batch_size=None):
+    """
+    Purge read notifications older than retention_days, collapse older
+    repeated notifications into summaries and drop dispatched outbox entries
+    past retention. Returns a dict of row counts.
+    """
+    config = current_app.config
+    retention_days = retention_days or config.get('NOTIFICATION_RETENTION_DAYS', 90)
+    collapse_after_days = collapse_after_days or config.get('NOTIFICATION_COLLAPSE_AFTER_DAYS', 30)
+    batch_size = batch_size or config.get('NOTIFICATION_COMPACTION_BATCH_SIZE', 1000)
+    # Notification timestamps are local time (created_at defaults to
+    # datetime.now) and outbox timestamps UTC; both cutoffs come from this one
+    # reading of the clock.
+    now = datetime.now()
+
+    purged = delete_in_batches(Notification, Notification.notification_id, db.and_(
+        Notification.read_status == True,
+        Notification.created_at < now - timedelta(days=retention_days)
+    ), batch_size)
+    collapsed, summaries = collapse_notifications(
+        now - timedelta(days=collapse_after_days),
+        config.get('NOTIFICATION_COLLAPSE_MIN', 5),
+        batch_size
+    )
+    outbox_purged = delete_in_batches(NotificationOutbox, NotificationOutbox.outbox_id, db.and_(
+        NotificationOutbox.status == 'done',
+        NotificationOutbox.processed_at < local_to_utc(now) - timedelta(days=retention_days)
+    ), batch_size)
+
+    # Bulk deletes bypass the per-user invalidation hooks.
+    invalidate_on_commit(db.session, notification_states)
+    db.session.commit()
+
+    return {
+        'purged': purged,
+        'collapsed': collapsed,
+        'summaries': summaries,
+        'outbox_purged': outbox_purged,
+        'reclaimed': purged + collapsed - summaries + outbox_purged
+    }
+
+
+def as_date(value):
+    """func.date() gives a date on MySQL but an ISO string on SQLite."""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def daily_aggregate(day_column, dimension, count_column, start, end, sum_column=None, joins=()):
+    """
+    Count (and optionally sum) rows per day and dimension for days in
+    [start, end]. Returns {(day, dimension): [count, sum]}.
+    """
+    day = func.date(day_column)
+    dimension = dimension if dimension is not None else db.literal('all')
+    query = db.session.query(
+        day.label('day'),
+        dimension.label('dimension'),
+        func.count(count_column),
+        func.sum(sum_column) if sum_column is not None else db.literal(None)
+    )
+    for target, onclause in joins:
+        query = query.join(target, onclause)
+    if isinstance(day_column.type, db.Date):
+        query = query.filter(day_column >= start, day_column <= end)
+    else:
+        query = query.filter(
+            day_column >= datetime.combine(start, datetime.min.time()),
+            day_column < datetime.combine(end + timedelta(days=1), datetime.min.time())
+        )
+    return {
+        (as_date(row_day), str(row_dimension) if row_dimension is not None else 'none'): [count, total]
+        for row_day, row_dimension, count, total in query.group_by(day, dimension)
+    }
+
+def rollup_metrics(start, end):
+    """Compute every daily metric for [start, end] from the base tables."""
+    messages = daily_aggregate(Message.sent_at, Message.sender_type, Message.message_id, start, end)
+    for key, (count, _) in daily_aggregate(
+        MessageArchive.sent_at, MessageArchive.sender_type, MessageArchive.message_id, start, end
+    ).items():
+        messages.setdefault(key, [0, None])[0] += count
+
+    return {
+        'new_students': daily_aggregate(Student.date_registered, None, Student.id, start, end),
+        'appointments': daily_aggregate(Appointment.appointment_date, Appointment.status, Appointment.id, start, end),
+        'grievances': daily_aggregate(Grievance.created_at, Grievance.status, Grievance.id, start, end),
+        'event_attendance': daily_aggregate(
+            Event.event_date, EventRegistration.attendance_status, EventRegistration.registration_id, start, end,
+            joins=[(Event, Event.event_id == EventRegistration.event_id)]
+        ),
+        'messages_sent': messages,
+        'feedback': daily_aggregate(
+            Feedback.created_at, Feedback.counsellor_id, Feedback.feedback_id, start, end, sum_column=Feedback.rating
+        )
+    }
+
+def rollup_daily(start=None, end=None):
+    """
+    Recompute the daily_rollups rows for [start, end] in one transaction, so
+    readers see either the old or the new figures. By default picks up from the
+    last rolled-up day minus ANALYTICS_ROLLUP_LOOKBACK_DAYS (to catch late
+    status changes), or backfills ANALYTICS_ROLLUP_BACKFILL_DAYS on first run.
+    Returns (start, end, rows written).
+    """
+    config = current_app.config
+    end = end or date.today()
+    if start is None:
+        last_day = db.session.query(func.max(DailyRollup.day)).scalar()
+        if last_day is None:
+            start = end - timedelta(days=config.get('ANALYTICS_ROLLUP_BACKFILL_DAYS', 365))
+        else:
+            start = as_date(last_day) - timedelta(days=config.get('ANALYTICS_ROLLUP_LOOKBACK_DAYS', 2))
+
+    metrics = rollup_metrics(start, end)
+    now = datetime.utcnow()
+    rows = [{
+        'day': day,
+        'metric': metric,
+        'dimension': dimension,
+        'value_count': count,
+        'value_sum': total,
+        'computed_at': now
+    } for metric, values in metrics.items() for (day, dimension), (count, total) in values.items()]
+
+    try:
+        DailyRollup.query.filter(
+            DailyRollup.day >= start,
+            DailyRollup.day <= end,
+            DailyRollup.metric.in_(list(metrics))
+        ).delete(synchronize_session=False)
+        if rows:
+            db.session.execute(db.insert(DailyRollup).values(rows))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return start, end, len(rows)
+
+
+# Columns added to tables that already existed in earlier releases.
+ADDED_COLUMNS = (
+    ('notifications', 'collapsed_count', 'INT'),
+    ('conversations', 'archived_at', 'DATETIME'),
+)
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to the current models. create_all() only
+    creates missing tables, so added columns and indexes on existing tables
+    are applied here. Every step checks first, so it is safe to rerun.
+    Returns the names of the changes made.
+    """
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    applied = []
+    for table, column, ddl in ADDED_COLUMNS:
+        if column not in {c['name'] for c in inspector.get_columns(table)}:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            applied.append(f'{table}.{column}')
+    db.session.commit()
+
+    # Archived messages are stored as read; older archive runs left some
+    # unread. Recounting the threads also fills in conversations.archived_at.
+    marked = MessageArchive.query.filter_by(is_read=False).update({'is_read': True}, synchronize_session=False)
+    if marked or 'conversations.archived_at' in applied:
+        Conversation.rebuild()
+        applied.append('conversations rebuilt')
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                applied.append(index.name)
+
+    if ensure_search_index():
+        applied.append('message search index')
+    return applied
+
+
+def register_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Add the columns and indexes an existing database is missing."""
+        applied = upgrade_schema()
+        click.echo(f"Applied: {', '.join(applied)}" if applied else 'Schema is up to date')
+
+    @app.cli.command('archive-messages')
+    @click.option('--days', type=int, default=None, help='Archive messages older than this many days.')
+    @click.option('--batch-size', type=int, default=None, help='Rows moved per transaction.')
+    def archive_messages_command(days, batch_size):
+        """Move old chat messages into messages_archive."""
+        moved = archive_messages(days, batch_size)
+        click.echo(f'Archived {moved} messages')
+
+    @app.cli.command('dispatch-outbox')
+    def dispatch_outbox_command():
+        """Turn every pending outbox event into notifications now."""
+        handled = drain_outbox()
+        click.echo(f'Dispatched {handled} outbox events')
+
+    @app.cli.command('compact-notifications')
+    @click.option('--days', type=int, default=None, help='Delete read notifications older than this many days.')
+    @click.option('--collapse-days', type=int, default=None, help='Collapse repeated notifications older than this many days.')
+    @click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+    def compact_notifications_command(days, collapse_days, batch_size):
+        """Purge and collapse old notifications; meant to run daily from cron."""
+        report = compact_notifications(days, collapse_days, batch_size)
+        click.echo(
+            f"Reclaimed {report['reclaimed']} rows: purged {report['purged']} read notifications, "
+            f"collapsed {report['collapsed']} into {report['summaries']} summaries, "
+            f"removed {report['outbox_purged']} outbox entries"
+        )
+
+    @app.cli.command('rollup-analytics')
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First day to recompute (YYYY-MM-DD).')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last day to recompute; defaults to today.')
+    def rollup_analytics_command(since, until):
+        """Refresh the daily analytics rollups; meant to run nightly from cron."""
+        start, end, written = rollup_daily(since.date() if since else None, until.date() if until else None)
+        click.echo(f'Wrote {written} rollup rows for {start.isoformat()} to {end.isoformat()}')
@@ -2,11 +2,24 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, time
+import json
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from cache import TTLCache, invalidate_on_commit
 
 db = SQLAlchemy()
 
+counsellor_stats = TTLCache(ttl=60)
+student_dashboards = TTLCache(ttl=300)
+
 class CareerCounsellor(db.Model, UserMixin):
     __tablename__ = 'counsellors'
+    __table_args__ = (
+        db.Index('ix_counsellors_name', 'first_name', 'last_name'),
+        db.Index('ix_counsellors_last_name', 'last_name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
@@ -31,8 +44,33 @@ class CareerCounsellor(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @staticmethod
+    def dashboard_stats(counsellor_id):
+        """Student, upcoming appointment and pending request counts in one query, cached briefly."""
+        def compute():
+            today = datetime.now().date()
+            return db.session.query(
+                db.select(db.func.count(Student.id)).where(
+                    Student.counsellor_id == counsellor_id
+                ).scalar_subquery().label('total_students'),
+                db.select(db.func.count(Appointment.id)).where(
+                    Appointment.counsellor_id == counsellor_id,
+                    Appointment.appointment_date >= today,
+                    Appointment.status == 'scheduled'
+                ).scalar_subquery().label('upcoming_appointments'),
+                db.select(db.func.count(AppointmentRequest.id)).where(
+                    AppointmentRequest.counsellor_id == counsellor_id,
+                    AppointmentRequest.status == 'pending'
+                ).scalar_subquery().label('pending_requests')
+            ).one()._asdict()
+        return counsellor_stats.get_or_set(counsellor_id, compute)
+
 class Student(db.Model, UserMixin):
     __tablename__ = 'student'
+    __table_args__ = (
+        db.Index('ix_student_name', 'first_name', 'last_name'),
+        db.Index('ix_student_last_name', 'last_name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
@@ -114,6 +152,9 @@ class Grievance(db.Model):
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_counsellor_slot', 'counsellor_id', 'appointment_date', 'start_time', 'end_time', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     counsellor_id = db.Column(db.Integer, db.ForeignKey('counsellors.id', ondelete='CASCADE'), nullable=False)
@@ -145,6 +186,23 @@ class Appointment(db.Model):
             'location': self.location
         }
 
+    @classmethod
+    def overlapping(cls, counsellor_id, day, start_time, end_time, duration):
+        """
+        Filter clause for the counsellor's appointments on day that intersect
+        [start_time, end_time). Rows without an end_time last duration.
+        """
+        earliest = datetime.combine(day, start_time) - duration
+        return db.and_(
+            cls.counsellor_id == counsellor_id,
+            cls.appointment_date == day,
+            cls.start_time < end_time,
+            db.func.coalesce(
+                cls.end_time > start_time,
+                cls.start_time > earliest.time() if earliest.date() == day else db.true()
+            )
+        )
+
 
 class Feedback(db.Model):
     __tablename__ = 'feedback'
@@ -186,8 +244,14 @@ class StudentDocument(db.Model):
     file_type = db.Column(db.String(10), nullable=False, default='other')  # pdf, doc, image, other
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
 
+notification_states = TTLCache(ttl=300)
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_unread', 'user_type', 'user_id', 'read_status', 'created_at'),
+        db.Index('ix_notifications_user_feed', 'user_type', 'user_id', 'created_at', 'notification_id'),
+    )
     notification_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     user_type = db.Column(db.Enum('student', 'counsellor', 'admin'), nullable=False)
@@ -196,6 +260,7 @@ class Notification(db.Model):
     read_status = db.Column(db.Boolean, default=False)
     notification_type = db.Column(db.Enum('general', 'appointment', 'resource', 'payment', 'grievance', 'appointment_request', 'feedback', 'event'), nullable=False)
     related_entity_id = db.Column(db.Integer)
+    collapsed_count = db.Column(db.Integer)
 
     def to_dict(self):
         return {
@@ -207,8 +272,203 @@ class Notification(db.Model):
             'related_entity_id': self.related_entity_id
         }
 
-class Message(db.Model):
-    __tablename__ = 'messages'
+    @property
+    def cursor(self):
+        return f"{self.created_at.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{self.notification_id}"
+
+    @staticmethod
+    def feed(user_type, user_id, before=None, after=None, limit=20):
+        """
+        One page of a user's notifications, newest first, keyset-paginated on
+        (created_at, notification_id). before/after are (created_at, id) keys
+        taken from a neighbouring page. Returns (notifications, has_more).
+        """
+        query = Notification.query.filter_by(user_type=user_type, user_id=user_id)
+        
+        if after:
+            created_at, notification_id = after
+            notifications = query.filter(db.or_(
+                Notification.created_at > created_at,
+                db.and_(Notification.created_at == created_at, Notification.notification_id > notification_id)
+            )).order_by(Notification.created_at.asc(), Notification.notification_id.asc()).limit(limit + 1).all()
+            has_more = len(notifications) > limit
+            notifications = notifications[:limit]
+            notifications.reverse()
+            return notifications, has_more
+        
+        if before:
+            created_at, notification_id = before
+            query = query.filter(db.or_(
+                Notification.created_at < created_at,
+                db.and_(Notification.created_at == created_at, Notification.notification_id < notification_id)
+            ))
+        notifications = query.order_by(
+            Notification.created_at.desc(),
+            Notification.notification_id.desc()
+        ).limit(limit + 1).all()
+        return notifications[:limit], len(notifications) > limit
+
+    @staticmethod
+    def inbox_state(user_type, user_id, cached=True):
+        """
+        (latest notification id, unread count) for one user, from two
+        index-only lookups. By default the pair is cached in this process until
+        the user's notifications change; pass cached=False where a value cached
+        before another worker's commit must not be trusted.
+        """
+        def compute():
+            latest_id = db.session.query(Notification.notification_id).filter_by(
+                user_type=user_type,
+                user_id=user_id
+            ).order_by(Notification.created_at.desc(), Notification.notification_id.desc()).limit(1).scalar()
+            unread = Notification.query.filter_by(
+                user_type=user_type,
+                user_id=user_id,
+                read_status=False
+            ).count()
+            return latest_id or 0, unread
+        if not cached:
+            return compute()
+        return notification_states.get_or_set((user_type, user_id), compute)
+
+    @staticmethod
+    def unread_count(user_type, user_id):
+        """Unread badge count for one user, served from the inbox_state cache."""
+        return Notification.inbox_state(user_type, user_id)[1]
+
+    @staticmethod
+    def mark_all_read(user_type, user_id):
+        updated = Notification.query.execution_options(invalidates_own_caches=True).filter_by(
+            user_type=user_type,
+            user_id=user_id,
+            read_status=False
+        ).update({'read_status': True}, synchronize_session=False)
+        invalidate_on_commit(db.session, notification_states, (user_type, user_id))
+        return updated
+
+    @staticmethod
+    def insert_many(rows):
+        """
+        Insert notifications given as dicts of column values with one multi-row
+        INSERT instead of one ORM object per recipient. Returns the row count.
+        """
+        if not rows:
+            return 0
+        now = datetime.now()
+        for row in rows:
+            invalidate_on_commit(db.session, notification_states, (row['user_type'], row['user_id']))
+        db.session.execute(db.insert(Notification).values([
+            dict({'created_at': now, 'read_status': False, 'related_entity_id': None, 'collapsed_count': None}, **row) for row in rows
+        ]))
+        return len(rows)
+
+    @staticmethod
+    def fan_out(user_type, recipients, message, notification_type, related_entity_id=None):
+        """
+        Send the same notification to every user id in recipients. recipients is
+        either a list of ids or a select() of one id column; a select is copied
+        server-side with INSERT ... SELECT so the ids never reach Python.
+        """
+        if not isinstance(recipients, Select):
+            return Notification.insert_many([{
+                'user_id': user_id,
+                'user_type': user_type,
+                'message': message,
+                'notification_type': notification_type,
+                'related_entity_id': related_entity_id
+            } for user_id in recipients])
+
+        # The recipients are only known to the database, so forget every cached count.
+        invalidate_on_commit(db.session, notification_states)
+        result = db.session.execute(db.insert(Notification).from_select(
+            ['user_id', 'user_type', 'message', 'notification_type', 'related_entity_id', 'created_at', 'read_status'],
+            recipients.add_columns(
+                db.literal(user_type),
+                db.literal(message),
+                db.literal(notification_type),
+                db.literal(related_entity_id, db.Integer),
+                db.literal(datetime.now(), db.DateTime),
+                db.literal(False)
+            )
+        ))
+        return result.rowcount
+
+class NotificationOutbox(db.Model):
+    """
+    Domain events waiting to be turned into notifications. Rows are written in
+    the same transaction as the change they describe and processed later by
+    the dispatcher in outbox.py.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status', 'status', 'outbox_id'),
+    )
+    outbox_id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Enum('pending', 'processing', 'done', 'failed'), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claim_token = db.Column(db.String(36))
+    claimed_at = db.Column(db.DateTime)
+    available_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def enqueue(event_type, **payload):
+        """Record an event in the current transaction; it is dispatched once that commits."""
+        entry = NotificationOutbox(event_type=event_type, payload=json.dumps(payload), status='pending')
+        db.session.add(entry)
+        db.session.info['outbox_enqueued'] = True
+        return entry
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_unread_counts(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Notification):
+            invalidate_on_commit(session, notification_states, (obj.user_type, obj.user_id))
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_counsellor_stats(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Student, Appointment, AppointmentRequest)):
+            # A reassignment changes the stats of the previous counsellor too.
+            history = db.inspect(obj).attrs.counsellor_id.history
+            for counsellor_id in set(history.deleted or ()) | {obj.counsellor_id}:
+                if counsellor_id is not None:
+                    invalidate_on_commit(session, counsellor_stats, counsellor_id)
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_student_dashboards(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, STUDENT_DASHBOARD_MODELS):
+            invalidate_on_commit(session, student_dashboards, obj.student_id)
+        elif isinstance(obj, Student):
+            invalidate_on_commit(session, student_dashboards, obj.id)
+        elif isinstance(obj, GoalMilestone):
+            with session.no_autoflush:
+                goal = session.get(CareerGoal, obj.goal_id) if obj.goal_id else None
+            if goal is not None:
+                invalidate_on_commit(session, student_dashboards, goal.student_id)
+        elif isinstance(obj, SHARED_DASHBOARD_MODELS):
+            invalidate_on_commit(session, student_dashboards)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_caches_in_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete) or orm_execute_state.bind_mapper is None:
+        return
+    model = orm_execute_state.bind_mapper.class_
+    if model in (Student, Appointment, AppointmentRequest):
+        invalidate_on_commit(orm_execute_state.session, counsellor_stats)
+    if model in STUDENT_DASHBOARD_MODELS + SHARED_DASHBOARD_MODELS + (Student, GoalMilestone):
+        invalidate_on_commit(orm_execute_state.session, student_dashboards)
+    if model is Notification and not orm_execute_state.execution_options.get('invalidates_own_caches'):
+        # The statement's recipients are not known here, so forget every cached count.
+        invalidate_on_commit(orm_execute_state.session, notification_states)
+
+class MessageMixin:
+    """Columns and helpers shared by the live messages table and its archive"""
     message_id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, nullable=False)
     recipient_id = db.Column(db.Integer, nullable=False)
@@ -230,6 +490,251 @@ class Message(db.Model):
             'is_read': self.is_read
         }
 
+    @classmethod
+    def between(cls, user_type, user_id, partner_type, partner_id):
+        """Filter clause matching every message exchanged between two users, in either direction"""
+        return db.or_(
+            db.and_(
+                cls.sender_type == user_type,
+                cls.sender_id == user_id,
+                cls.recipient_type == partner_type,
+                cls.recipient_id == partner_id
+            ),
+            db.and_(
+                cls.sender_type == partner_type,
+                cls.sender_id == partner_id,
+                cls.recipient_type == user_type,
+                cls.recipient_id == user_id
+            )
+        )
+
+class Message(MessageMixin, db.Model):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_conversation', 'sender_type', 'sender_id', 'recipient_type', 'recipient_id', 'sent_at', 'message_id'),
+        db.Index('ix_messages_sent_at', 'sent_at'),
+    )
+
+    @staticmethod
+    def mark_conversation_read(user_type, user_id, partner_type, partner_id, up_to_id):
+        """Flag every unread message from partner to user with an id up to up_to_id as read in one UPDATE"""
+        updated = Message.query.filter(
+            Message.sender_type == partner_type,
+            Message.sender_id == partner_id,
+            Message.recipient_type == user_type,
+            Message.recipient_id == user_id,
+            Message.is_read == False,
+            Message.message_id <= up_to_id
+        ).update({'is_read': True}, synchronize_session=False)
+        if updated:
+            Conversation.record_read(user_type, user_id, partner_id, updated)
+        return updated
+
+class MessageArchive(MessageMixin, db.Model):
+    """Cold storage for messages moved out of the hot messages table by the archival job"""
+    __tablename__ = 'messages_archive'
+    __table_args__ = (
+        db.Index('ix_messages_archive_conversation', 'sender_type', 'sender_id', 'recipient_type', 'recipient_id', 'sent_at', 'message_id'),
+    )
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Conversation(db.Model):
+    """Materialized student/counsellor thread, kept in step with messages in the same transaction"""
+    __tablename__ = 'conversations'
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
+    counsellor_id = db.Column(db.Integer, db.ForeignKey('counsellors.id', ondelete='CASCADE'), primary_key=True)
+    last_message_id = db.Column(db.Integer)
+    student_unread = db.Column(db.Integer, nullable=False, default=0)
+    counsellor_unread = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # sent_at of the newest message moved to messages_archive; NULL while nothing is archived
+    archived_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_conversations_counsellor', 'counsellor_id', 'last_message_id'),
+    )
+
+    @staticmethod
+    def key_for(user_type, user_id, partner_id):
+        """Return the (student_id, counsellor_id) primary key as seen from one participant"""
+        if user_type == 'student':
+            return user_id, partner_id
+        return partner_id, user_id
+
+    @staticmethod
+    def participants(model):
+        """(student_id, counsellor_id) SQL expressions for the rows of Message or MessageArchive"""
+        return (
+            db.case((model.sender_type == 'student', model.sender_id), else_=model.recipient_id),
+            db.case((model.sender_type == 'counsellor', model.sender_id), else_=model.recipient_id)
+        )
+
+    @staticmethod
+    def archived_at_for(user_type, user_id, partner_type, partner_id):
+        """archived_at of one thread by primary key, or None when none of it is archived"""
+        if user_type == partner_type:
+            return None
+        conversation = db.session.get(Conversation, Conversation.key_for(user_type, user_id, partner_id))
+        return conversation.archived_at if conversation else None
+
+    @staticmethod
+    def upsert(rows, on_conflict):
+        """
+        Insert rows in one statement. A row whose thread already exists gets
+        on_conflict(proposed) applied instead, where proposed holds the values
+        it would have been inserted with, so concurrent first messages of a
+        thread cannot both try to insert it.
+        """
+        dialect = db.engine.dialect.name
+        if dialect == 'mysql':
+            statement = mysql.insert(Conversation).values(rows)
+            return db.session.execute(statement.on_duplicate_key_update(on_conflict(statement.inserted)))
+        if dialect in ('sqlite', 'postgresql'):
+            statement = (sqlite if dialect == 'sqlite' else postgresql).insert(Conversation).values(rows)
+            return db.session.execute(statement.on_conflict_do_update(
+                index_elements=['student_id', 'counsellor_id'],
+                set_=on_conflict(statement.excluded)
+            ))
+        raise NotImplementedError(f'Conversation.upsert does not support {dialect}')
+
+    @staticmethod
+    def record_message(message):
+        """Move the thread's last message pointer and bump the recipient's unread counter. The message must be flushed."""
+        if message.sender_type == message.recipient_type:
+            return
+        student_id, counsellor_id = Conversation.key_for(message.sender_type, message.sender_id, message.recipient_id)
+        unread = 'student_unread' if message.recipient_type == 'student' else 'counsellor_unread'
+        
+        Conversation.upsert([{
+            'student_id': student_id,
+            'counsellor_id': counsellor_id,
+            'last_message_id': message.message_id,
+            'student_unread': 1 if unread == 'student_unread' else 0,
+            'counsellor_unread': 1 if unread == 'counsellor_unread' else 0,
+            'updated_at': message.sent_at
+        }], lambda proposed: {
+            'last_message_id': proposed.last_message_id,
+            'updated_at': proposed.updated_at,
+            unread: getattr(Conversation, unread) + 1
+        })
+
+    @staticmethod
+    def record_broadcast(counsellor_id, messages):
+        """Apply one flushed counsellor-to-student message per student with a fixed number of statements"""
+        if not messages:
+            return
+        Conversation.upsert([{
+            'student_id': message.recipient_id,
+            'counsellor_id': counsellor_id,
+            'last_message_id': message.message_id,
+            'student_unread': 1,
+            'counsellor_unread': 0,
+            'updated_at': message.sent_at
+        } for message in messages], lambda proposed: {
+            'last_message_id': proposed.last_message_id,
+            'updated_at': proposed.updated_at,
+            'student_unread': Conversation.student_unread + 1
+        })
+
+    @staticmethod
+    def record_read(user_type, user_id, partner_id, count):
+        student_id, counsellor_id = Conversation.key_for(user_type, user_id, partner_id)
+        unread_column = Conversation.student_unread if user_type == 'student' else Conversation.counsellor_unread
+        return Conversation.query.filter_by(
+            student_id=student_id,
+            counsellor_id=counsellor_id
+        ).update({
+            unread_column: db.case((unread_column > count, unread_column - count), else_=0)
+        }, synchronize_session=False)
+
+    @staticmethod
+    def record_archive(message_ids):
+        """
+        Before message_ids move to messages_archive: advance each thread's
+        archived_at and take the unread ones off its counters, because archived
+        messages are stored as read and reads never touch the archive.
+        """
+        student_id, counsellor_id = Conversation.participants(Message)
+        unread_for = lambda user_type: db.func.sum(db.case(
+            (db.and_(Message.recipient_type == user_type, Message.is_read == False), 1), else_=0
+        ))
+        rows = db.session.query(
+            student_id.label('student_id'),
+            counsellor_id.label('counsellor_id'),
+            db.func.max(Message.sent_at).label('archived_at'),
+            unread_for('student').label('student_unread'),
+            unread_for('counsellor').label('counsellor_unread')
+        ).filter(
+            Message.message_id.in_(message_ids),
+            Message.sender_type != Message.recipient_type
+        ).group_by(student_id, counsellor_id).all()
+        
+        for row in rows:
+            # Messages are archived oldest first, so each batch only moves archived_at forward.
+            values = {'archived_at': row.archived_at}
+            for column, count in ((Conversation.student_unread, row.student_unread), (Conversation.counsellor_unread, row.counsellor_unread)):
+                if count:
+                    values[column] = db.case((column > count, column - count), else_=0)
+            Conversation.query.filter_by(
+                student_id=row.student_id,
+                counsellor_id=row.counsellor_id
+            ).update(values, synchronize_session=False)
+        return len(rows)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every conversation row from the messages tables (used to backfill existing data)"""
+        student_id, counsellor_id = Conversation.participants(Message)
+        unread_for = lambda user_type: db.func.sum(db.case(
+            (db.and_(Message.recipient_type == user_type, Message.is_read == False), 1), else_=0
+        ))
+        
+        rows = db.session.query(
+            student_id.label('student_id'),
+            counsellor_id.label('counsellor_id'),
+            db.func.max(Message.message_id).label('last_message_id'),
+            db.func.max(Message.sent_at).label('updated_at'),
+            unread_for('student').label('student_unread'),
+            unread_for('counsellor').label('counsellor_unread')
+        ).filter(Message.sender_type != Message.recipient_type).group_by(student_id, counsellor_id).all()
+        
+        archive_student_id, archive_counsellor_id = Conversation.participants(MessageArchive)
+        archived = {(row.student_id, row.counsellor_id): row for row in db.session.query(
+            archive_student_id.label('student_id'),
+            archive_counsellor_id.label('counsellor_id'),
+            db.func.max(MessageArchive.message_id).label('last_message_id'),
+            db.func.max(MessageArchive.sent_at).label('updated_at')
+        ).filter(
+            MessageArchive.sender_type != MessageArchive.recipient_type
+        ).group_by(archive_student_id, archive_counsellor_id)}
+        
+        conversations = {}
+        for row in rows:
+            archive = archived.get((row.student_id, row.counsellor_id))
+            conversations[row.student_id, row.counsellor_id] = Conversation(
+                student_id=row.student_id,
+                counsellor_id=row.counsellor_id,
+                last_message_id=row.last_message_id,
+                student_unread=int(row.student_unread or 0),
+                counsellor_unread=int(row.counsellor_unread or 0),
+                updated_at=row.updated_at,
+                archived_at=archive.updated_at if archive else None
+            )
+        for key, row in archived.items():
+            conversations.setdefault(key, Conversation(
+                student_id=row.student_id,
+                counsellor_id=row.counsellor_id,
+                last_message_id=row.last_message_id,
+                student_unread=0,
+                counsellor_unread=0,
+                updated_at=row.updated_at,
+                archived_at=row.updated_at
+            ))
+        
+        Conversation.query.delete()
+        db.session.add_all(conversations.values())
+        return len(conversations)
+
 class CareerGoal(db.Model):
     __tablename__ = 'career_goals'
     goal_id = db.Column(db.Integer, primary_key=True)
@@ -274,11 +779,14 @@ class Event(db.Model):
    
     registrations = db.relationship('EventRegistration',
                                   backref=db.backref('event', lazy=True),
-                                  lazy='joined',
+                                  lazy='select',
                                   cascade='all, delete-orphan')
 
 class EventRegistration(db.Model):
     __tablename__ = 'event_registrations'
+    __table_args__ = (
+        db.Index('ix_event_registrations_event_student', 'event_id', 'student_id'),
+    )
     registration_id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('events.event_id', ondelete='CASCADE'))
     student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'))
@@ -289,6 +797,15 @@ class EventRegistration(db.Model):
     
     student = db.relationship('Student', backref=db.backref('event_registrations', lazy=True))
 
+# Registration count as a correlated subquery. Deferred, so listing queries opt in
+# with db.undefer(Event.registered_count) instead of loading every registration.
+Event.registered_count = db.column_property(
+    db.select(db.func.count(EventRegistration.registration_id)).where(
+        EventRegistration.event_id == Event.event_id
+    ).correlate_except(EventRegistration).scalar_subquery(),
+    deferred=True
+)
+
 class Task(db.Model):
     __tablename__ = 'tasks'
     task_id = db.Column(db.Integer, primary_key=True)
@@ -319,6 +836,9 @@ class Task(db.Model):
 
 class AppointmentRequest(db.Model):
     __tablename__ = 'appointment_requests'
+    __table_args__ = (
+        db.Index('ix_appointment_requests_counsellor_slot', 'counsellor_id', 'preferred_date', 'status', 'preferred_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     counsellor_id = db.Column(db.Integer, db.ForeignKey('counsellors.id', ondelete='CASCADE'), nullable=False)
@@ -348,4 +868,36 @@ class AppointmentRequest(db.Model):
             'status': self.status,
             'created_at': self.created_at,
             'updated_at': self.updated_at
-        }
\ No newline at end of file
+        }
+
+    @classmethod
+    def overlapping(cls, counsellor_id, day, start_time, end_time, duration):
+        """Filter clause for the counsellor's requests on day whose duration-long slot intersects [start_time, end_time)"""
+        earliest = datetime.combine(day, start_time) - duration
+        return db.and_(
+            cls.counsellor_id == counsellor_id,
+            cls.preferred_date == day,
+            cls.preferred_time < end_time,
+            cls.preferred_time > earliest.time() if earliest.date() == day else db.true()
+        )
+
+class DailyRollup(db.Model):
+    """
+    One precomputed daily aggregate, e.g. (2025-06-01, 'appointments', 'completed').
+    value_sum carries a total alongside the count where averages are needed.
+    """
+    __tablename__ = 'daily_rollups'
+    __table_args__ = (
+        db.Index('ix_daily_rollups_metric_day', 'metric', 'day'),
+    )
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)
+    dimension = db.Column(db.String(50), primary_key=True, default='all')
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Numeric(12, 2))
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Models whose rows feed the student dashboard, keyed by their student_id.
+STUDENT_DASHBOARD_MODELS = (CareerGoal, Appointment, AppointmentRequest, Grievance, EventRegistration, Feedback, Task)
+# Models shown on every student's dashboard; a change to any of them clears all cached dashboards.
+SHARED_DASHBOARD_MODELS = (Event, CounsellorSchedule, CareerCounsellor)
@@ -0,0 +1,273 @@
+import json
+import logging
+import smtplib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import (
+    db, Notification, NotificationOutbox, AppointmentRequest, Student, CareerCounsellor, Administrator
+)
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+USER_MODELS = {'student': Student, 'counsellor': CareerCounsellor, 'admin': Administrator}
+
+dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def outbox_handler(event_type):
+    """Register a function turning an event payload into a list of notification rows."""
+    def decorator(f):
+        HANDLERS[event_type] = f
+        return f
+    return decorator
+
+
+@outbox_handler('appointment_requested')
+def appointment_requested(payload):
+    appointment_request = db.session.get(AppointmentRequest, payload['request_id'])
+    if appointment_request is None:
+        return []
+    student = appointment_request.student
+    when = f'{appointment_request.preferred_date.strftime("%B %d, %Y")} at {appointment_request.preferred_time.strftime("%I:%M %p")}'
+    return [{
+        'user_id': appointment_request.counsellor_id,
+        'user_type': 'counsellor',
+        'message': f'New appointment request from {student.first_name} {student.last_name} for {when}',
+        'notification_type': 'appointment',
+        'related_entity_id': appointment_request.id
+    }, {
+        'user_id': appointment_request.student_id,
+        'user_type': 'student',
+        'message': f'Your appointment request for {when} has been submitted.',
+        'notification_type': 'appointment',
+        'related_entity_id': appointment_request.id
+    }]
+
+@outbox_handler('appointment_approved')
+def appointment_approved(payload):
+    appointment_request = db.session.get(AppointmentRequest, payload['request_id'])
+    if appointment_request is None:
+        return []
+    when = f'{appointment_request.preferred_date.strftime("%B %d, %Y")} at {appointment_request.preferred_time.strftime("%I:%M %p")}'
+    return [{
+        'user_id': appointment_request.student_id,
+        'user_type': 'student',
+        'message': f'Your appointment request for {when} has been approved.',
+        'notification_type': 'appointment',
+        'related_entity_id': payload['appointment_id']
+    }, {
+        'user_id': appointment_request.counsellor_id,
+        'user_type': 'counsellor',
+        'message': f'You have approved the appointment request for {when}',
+        'notification_type': 'appointment',
+        'related_entity_id': payload['appointment_id']
+    }]
+
+
+def claim_batch(batch_size, claim_timeout):
+    """
+    Mark up to batch_size pending entries as ours and return their ids. Entries
+    stuck in processing longer than claim_timeout seconds are taken over, so a
+    crashed worker never strands an event.
+    """
+    now = datetime.utcnow()
+    claimable = db.or_(
+        db.and_(
+            NotificationOutbox.status == 'pending',
+            db.or_(NotificationOutbox.available_at.is_(None), NotificationOutbox.available_at <= now)
+        ),
+        db.and_(
+            NotificationOutbox.status == 'processing',
+            NotificationOutbox.claimed_at < now - timedelta(seconds=claim_timeout)
+        )
+    )
+    ids = [outbox_id for (outbox_id,) in db.session.query(NotificationOutbox.outbox_id).filter(
+        claimable
+    ).order_by(NotificationOutbox.outbox_id).limit(batch_size)]
+    if not ids:
+        db.session.rollback()
+        return []
+
+    token = str(uuid.uuid4())
+    NotificationOutbox.query.filter(NotificationOutbox.outbox_id.in_(ids), claimable).update({
+        'status': 'processing',
+        'claim_token': token,
+        'claimed_at': now,
+        'attempts': NotificationOutbox.attempts + 1
+    }, synchronize_session=False)
+    db.session.commit()
+    return [outbox_id for (outbox_id,) in db.session.query(NotificationOutbox.outbox_id).filter_by(claim_token=token)]
+
+def process_entry(outbox_id, max_attempts=5, send_emails=False, retry_delay=30):
+    """
+    Run the handler for one claimed entry and store its notifications in the
+    same commit that marks it done. Failures are retried with exponential
+    backoff until max_attempts.
+    """
+    entry = db.session.get(NotificationOutbox, outbox_id)
+    try:
+        handler = HANDLERS.get(entry.event_type)
+        if handler is None:
+            raise LookupError(f'No outbox handler for {entry.event_type}')
+        rows = handler(json.loads(entry.payload))
+        Notification.insert_many(rows)
+        entry.status = 'done'
+        entry.processed_at = datetime.utcnow()
+        entry.last_error = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f'Error dispatching outbox entry {outbox_id}: {str(e)}')
+        entry = db.session.get(NotificationOutbox, outbox_id)
+        entry.status = 'failed' if entry.attempts >= max_attempts else 'pending'
+        entry.available_at = datetime.utcnow() + timedelta(seconds=min(retry_delay * 2 ** (entry.attempts - 1), 3600))
+        entry.last_error = str(e)
+        db.session.commit()
+        return False
+
+    if send_emails and rows:
+        try:
+            send_notification_emails(rows)
+        except (OSError, smtplib.SMTPException) as e:
+            logger.error(f'Error emailing notifications for outbox entry {outbox_id}: {str(e)}')
+    return True
+
+def send_notification_emails(rows):
+    config = current_app.config
+
+    addresses = {}
+    for user_type, model in USER_MODELS.items():
+        ids = {row['user_id'] for row in rows if row['user_type'] == user_type}
+        if ids:
+            addresses.update({(user_type, user_id): email for user_id, email in db.session.query(
+                model.id, model.email
+            ).filter(model.id.in_(ids))})
+
+    with smtplib.SMTP(config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 1025), timeout=10) as smtp:
+        for row in rows:
+            recipient = addresses.get((row['user_type'], row['user_id']))
+            if not recipient:
+                continue
+            email = EmailMessage()
+            email['From'] = config.get('MAIL_DEFAULT_SENDER', 'no-reply@localhost')
+            email['To'] = recipient
+            email['Subject'] = f"Career Counselling: {row['notification_type'].replace('_', ' ')} update"
+            email.set_content(row['message'])
+            smtp.send_message(email)
+
+def drain_outbox():
+    """Process every pending entry in the calling thread. Returns the number handled."""
+    config = current_app.config
+    handled = 0
+    while True:
+        ids = claim_batch(config.get('OUTBOX_BATCH_SIZE', 50), config.get('OUTBOX_CLAIM_TIMEOUT', 300))
+        if not ids:
+            return handled
+        for outbox_id in ids:
+            process_entry(
+                outbox_id,
+                config.get('OUTBOX_MAX_ATTEMPTS', 5),
+                config.get('NOTIFICATION_EMAILS_ENABLED', False),
+                config.get('OUTBOX_RETRY_DELAY', 30)
+            )
+        handled += len(ids)
+
+
+class OutboxDispatcher:
+    """
+    Background poller that claims outbox entries and fans them out to a thread
+    pool. Commits that enqueue events wake it early; otherwise it polls every
+    OUTBOX_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('OUTBOX_WORKERS', 4),
+            thread_name_prefix='outbox'
+        )
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        self.executor.shutdown(wait=True)
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self):
+        config = self.app.config
+        with self.app.app_context():
+            ids = claim_batch(config.get('OUTBOX_BATCH_SIZE', 50), config.get('OUTBOX_CLAIM_TIMEOUT', 300))
+        wait([self.executor.submit(self._process, outbox_id) for outbox_id in ids])
+        return len(ids)
+
+    def _process(self, outbox_id):
+        config = self.app.config
+        with self.app.app_context():
+            process_entry(
+                outbox_id,
+                config.get('OUTBOX_MAX_ATTEMPTS', 5),
+                config.get('NOTIFICATION_EMAILS_ENABLED', False),
+                config.get('OUTBOX_RETRY_DELAY', 30)
+            )
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                handled = self.run_once()
+            except Exception as e:
+                logger.error(f'Outbox dispatcher error: {str(e)}')
+                handled = 0
+            if not handled:
+                self._wake.wait(self.app.config.get('OUTBOX_POLL_INTERVAL', 5))
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('outbox_enqueued', False) and dispatcher is not None:
+        dispatcher.wake()
+
+
+def start_outbox(app):
+    """Start this process's dispatcher unless it is running or disabled."""
+    global dispatcher
+    if dispatcher is not None or not app.config.get('OUTBOX_DISPATCHER_ENABLED', True):
+        return dispatcher
+    with _dispatcher_lock:
+        if dispatcher is None:
+            dispatcher = OutboxDispatcher(app)
+            dispatcher.start()
+    return dispatcher
+
+
+def init_outbox(app):
+    """
+    Start the dispatcher on the first request a process serves. That covers
+    flask run, each gunicorn worker (after the fork) and any other WSGI host,
+    while init_db.py, CLI commands and the debug reloader's parent process,
+    which serve no requests, never start one. Deployments that set
+    OUTBOX_DISPATCHER_ENABLED = False drain the outbox with
+    'flask dispatch-outbox' from cron instead.
+    """
+    @app.before_request
+    def ensure_outbox_dispatcher():
+        start_outbox(app)
@@ -0,0 +1,115 @@
+import json
+import queue
+import threading
+import time
+
+
+class MessageHub:
+    """In-process publish/subscribe hub for pushing chat events to connected clients.
+
+    Subscribers are keyed by (user_type, user_id). Each subscriber gets its own
+    queue so a slow browser tab never blocks the request that publishes.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_type, user_id):
+        q = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault((user_type, int(user_id)), set()).add(q)
+        return q
+
+    def unsubscribe(self, user_type, user_id, q):
+        key = (user_type, int(user_id))
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if not subscribers:
+                return
+            subscribers.discard(q)
+            if not subscribers:
+                del self._subscribers[key]
+
+    def publish(self, user_type, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get((user_type, int(user_id)), ()))
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                # The client stopped reading; it will resync from the REST API on reconnect.
+                pass
+        return len(subscribers)
+
+    def publish_message(self, message):
+        """Deliver a newly committed Message to both participants."""
+        data = message.to_dict()
+        self.publish(message.recipient_type, message.recipient_id, 'message', data)
+        self.publish(message.sender_type, message.sender_id, 'message', data)
+
+    def publish_read(self, reader_type, reader_id, partner_type, partner_id, up_to):
+        """Tell the other participant that reader has read everything up to message id up_to."""
+        self.publish(partner_type, partner_id, 'read', {
+            'reader_type': reader_type,
+            'reader_id': int(reader_id),
+            'up_to': up_to
+        })
+
+    def subscriber_count(self, user_type, user_id):
+        with self._lock:
+            return len(self._subscribers.get((user_type, int(user_id)), ()))
+
+
+class PresenceStore:
+    """In-memory presence with a TTL.
+
+    A user counts as online while any of their connections has touched the
+    store within the last ttl seconds; entries simply expire, so a tab that
+    dies without a clean close drops out on its own.
+    """
+
+    def __init__(self, ttl=45):
+        self.ttl = ttl
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_type, user_id):
+        """Mark the user as seen now. Returns True if they were offline before."""
+        key = (user_type, int(user_id))
+        now = time.monotonic()
+        with self._lock:
+            last_seen = self._last_seen.get(key)
+            self._last_seen[key] = now
+        return last_seen is None or now - last_seen > self.ttl
+
+    def forget(self, user_type, user_id):
+        with self._lock:
+            self._last_seen.pop((user_type, int(user_id)), None)
+
+    def is_online(self, user_type, user_id):
+        with self._lock:
+            last_seen = self._last_seen.get((user_type, int(user_id)))
+        return last_seen is not None and time.monotonic() - last_seen <= self.ttl
+
+    def online_among(self, user_type, user_ids):
+        """Return the subset of user_ids currently online."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, last_seen in self._last_seen.items() if now - last_seen > self.ttl]
+            for key in expired:
+                del self._last_seen[key]
+            return {int(user_id) for user_id in user_ids if (user_type, int(user_id)) in self._last_seen}
+
+
+def format_sse(data, event=None):
+    payload = ''
+    if event:
+        payload += f'event: {event}\n'
+    payload += f'data: {json.dumps(data)}\n\n'
+    return payload
+
+
+message_hub = MessageHub()
+presence = PresenceStore()
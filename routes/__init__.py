@@ -3,6 +3,7 @@ from .admin import admin_bp
 from .counsellor import counsellor_bp
 from .main import main_bp
 from .messages import messages_bp
+from .api import api_bp
 
 def register_blueprints(app):
     app.register_blueprint(main_bp)
@@ -10,3 +11,4 @@ def register_blueprints(app):
     app.register_blueprint(admin_bp)
     app.register_blueprint(counsellor_bp)
     app.register_blueprint(messages_bp)
+    app.register_blueprint(api_bp)
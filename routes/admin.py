@@ -3,11 +3,14 @@ from flask_login import login_required, current_user
 from models import (
     db, Student, CareerCounsellor, Administrator, Appointment, Event, 
     Grievance, Notification, AppointmentRequest, EventRegistration, 
-    CareerGoal, GoalMilestone, StudentDocument, Feedback, Message, StudentResourceAccess
+    CareerGoal, GoalMilestone, StudentDocument, Feedback, Message, Conversation, StudentResourceAccess,
+    DailyRollup
 )
+from availability import check_slot, SlotUnavailable
 from functools import wraps
 from datetime import datetime, timedelta
-from sqlalchemy import desc
+from sqlalchemy import desc, func
+from routes.api import notification_page
 import os
 from flask import current_app
 
@@ -30,60 +33,87 @@ def dashboard():
         flash('Unauthorized access', 'danger')
         return redirect(url_for('main.index'))
 
+    today = datetime.now().date()
+    preview_size = current_app.config.get('ADMIN_DASHBOARD_PREVIEW', 3)
     
-    counsellors = CareerCounsellor.query.all()
     
+    stats = db.session.query(
+        db.select(func.count(Student.id)).scalar_subquery().label('total_students'),
+        db.select(func.count(CareerCounsellor.id)).scalar_subquery().label('total_counsellors'),
+        db.select(func.count(Appointment.id)).where(
+            Appointment.appointment_date >= today
+        ).scalar_subquery().label('upcoming_appointments'),
+        db.select(func.count(AppointmentRequest.id)).where(
+            AppointmentRequest.status == 'pending'
+        ).scalar_subquery().label('pending_requests')
+    ).one()._asdict()
     
-    students = Student.query.all()
     
-    
-    recent_grievances = Grievance.query.order_by(Grievance.created_at.desc()).limit(10).all()
+    recent_grievances = Grievance.query.options(
+        db.joinedload(Grievance.student)
+    ).order_by(Grievance.created_at.desc()).limit(preview_size).all()
     
     
     upcoming_appointments = Appointment.query.filter(
-        Appointment.appointment_date >= datetime.now().date()
-    ).order_by(Appointment.appointment_date, Appointment.start_time).all()
+        Appointment.appointment_date >= today
+    ).options(
+        db.joinedload(Appointment.student),
+        db.joinedload(Appointment.counsellor)
+    ).order_by(Appointment.appointment_date, Appointment.start_time).limit(preview_size).all()
     
     
-    pending_requests = AppointmentRequest.query.filter_by(status='pending').all()
+    pending_requests = AppointmentRequest.query.filter_by(status='pending').options(
+        db.joinedload(AppointmentRequest.student),
+        db.joinedload(AppointmentRequest.counsellor)
+    ).order_by(AppointmentRequest.created_at).limit(preview_size).all()
     
     
     upcoming_events = Event.query.filter(
-        Event.event_date >= datetime.now().date()
+        Event.event_date >= today
     ).options(
-        db.joinedload(Event.registrations).joinedload(EventRegistration.student)
-    ).order_by(Event.event_date, Event.start_time).all()
-
+        db.undefer(Event.registered_count)
+    ).order_by(Event.event_date, Event.start_time).limit(preview_size).all()
     
-    stats = {
-        'total_students': Student.query.count(),
-        'total_counsellors': CareerCounsellor.query.count()
-    }
-
     
-    all_students = Student.query.all()
-    active_counsellors = CareerCounsellor.query.filter_by(availability_status=True).all()
+    registrant_samples = registration_samples(
+        [event.event_id for event in upcoming_events],
+        current_app.config.get('ADMIN_EVENT_REGISTRANT_SAMPLE', 5)
+    )
 
     return render_template('admin/dashboard.html',
-                         counsellors=counsellors,
-                         students=students,
                          recent_grievances=recent_grievances,
                          upcoming_appointments=upcoming_appointments,
                          pending_requests=pending_requests,
                          upcoming_events=upcoming_events,
-                         stats=stats,
-                         all_students=all_students,
-                         active_counsellors=active_counsellors)
+                         registrant_samples=registrant_samples,
+                         stats=stats)
+
+def registration_samples(event_ids, per_event):
+    """{event_id: [EventRegistration, ...]} holding the first per_event registrations of each event, in one query."""
+    if not event_ids:
+        return {}
+    position = db.func.row_number().over(
+        partition_by=EventRegistration.event_id,
+        order_by=EventRegistration.registration_id
+    ).label('position')
+    ranked = db.select(EventRegistration.registration_id, position).where(
+        EventRegistration.event_id.in_(event_ids)
+    ).subquery()
+    
+    samples = {}
+    for registration in EventRegistration.query.join(
+        ranked, ranked.c.registration_id == EventRegistration.registration_id
+    ).filter(ranked.c.position <= per_event).options(
+        db.joinedload(EventRegistration.student)
+    ).order_by(EventRegistration.event_id, EventRegistration.registration_id):
+        samples.setdefault(registration.event_id, []).append(registration)
+    return samples
 
 @admin_bp.route('/manage-users')
 @login_required
 @admin_required
 def manage_users():
-    students = Student.query.all()
-    counsellors = CareerCounsellor.query.all()
-    return render_template('admin/manage_users.html',
-                         students=students,
-                         counsellors=counsellors)
+    return render_template('admin/manage_users.html')
 
 @admin_bp.route('/manage-counsellor/<int:counsellor_id>')
 @login_required
@@ -103,6 +133,182 @@ def manage_counsellor(counsellor_id):
                          assigned_students=assigned_students,
                          upcoming_appointments=upcoming_appointments)
 
+STUDENT_SORTS = {
+    'name': (Student.first_name, Student.last_name),
+    'email': (Student.email,),
+    'registered': (Student.date_registered,)
+}
+COUNSELLOR_SORTS = {
+    'name': (CareerCounsellor.first_name, CareerCounsellor.last_name),
+    'email': (CareerCounsellor.email,),
+    'specialization': (CareerCounsellor.specialization,),
+    'registered': (CareerCounsellor.date_registered,)
+}
+
+
+def prefix_search(model, q):
+    """
+    Match q as a prefix of the first name, last name or email. "jane do"
+    also matches first name "jane..." with last name "do...".
+    """
+    def starts_with(column, term):
+        term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return column.like(f'{term}%', escape='\\')
+
+    q = q.strip()
+    clauses = [starts_with(model.first_name, q), starts_with(model.last_name, q), starts_with(model.email, q)]
+    first, _, rest = q.partition(' ')
+    if rest.strip():
+        clauses.append(db.and_(starts_with(model.first_name, first), starts_with(model.last_name, rest.strip())))
+    return db.or_(*clauses)
+
+def table_page(query, model, sorts, default_sort='name'):
+    """
+    Apply q/sort/order/page/per_page from the query string to query. Returns
+    (rows, metadata) where metadata is ready to merge into the JSON response.
+    """
+    q = request.args.get('q', '').strip()
+    sort = request.args.get('sort', default_sort)
+    if sort not in sorts:
+        sort = default_sort
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', current_app.config.get('ADMIN_TABLE_PAGE_SIZE', 20), type=int)
+    per_page = max(1, min(per_page, current_app.config.get('ADMIN_TABLE_PAGE_SIZE_MAX', 100)))
+    
+    if q:
+        query = query.filter(prefix_search(model, q))
+    total = query.order_by(None).count()
+    
+    columns = sorts[sort] + (model.id,)
+    rows = query.order_by(*[
+        column.desc() if order == 'desc' else column.asc() for column in columns
+    ]).offset((page - 1) * per_page).limit(per_page).all()
+    
+    return rows, {
+        'q': q,
+        'sort': sort,
+        'order': order,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'has_more': page * per_page < total
+    }
+
+@admin_bp.route('/api/admin/students')
+@login_required
+@admin_required
+def list_students():
+    """One page of students with their counsellor, for the admin tables."""
+    try:
+        query = db.session.query(
+            Student.id, Student.first_name, Student.last_name, Student.email,
+            Student.is_active, Student.date_registered, Student.counsellor_id,
+            CareerCounsellor.first_name.label('counsellor_first_name'),
+            CareerCounsellor.last_name.label('counsellor_last_name')
+        ).outerjoin(CareerCounsellor, Student.counsellor_id == CareerCounsellor.id)
+        rows, page = table_page(query, Student, STUDENT_SORTS)
+        
+        return jsonify(dict(page, students=[{
+            'id': row.id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'email': row.email,
+            'is_active': row.is_active,
+            'date_registered': row.date_registered.strftime('%Y-%m-%d') if row.date_registered else None,
+            'counsellor': {
+                'id': row.counsellor_id,
+                'name': f'{row.counsellor_first_name} {row.counsellor_last_name or ""}'.strip()
+            } if row.counsellor_id else None
+        } for row in rows]))
+    except Exception:
+        current_app.logger.exception('Error listing students')
+        return jsonify({'error': 'Failed to load students'}), 500
+
+@admin_bp.route('/api/admin/counsellors')
+@login_required
+@admin_required
+def list_counsellors():
+    """One page of counsellors with their student counts. ?available=1 keeps only available ones."""
+    try:
+        student_counts = db.session.query(
+            Student.counsellor_id,
+            func.count(Student.id).label('student_count')
+        ).group_by(Student.counsellor_id).subquery()
+        student_count = func.coalesce(student_counts.c.student_count, 0)
+        query = db.session.query(
+            CareerCounsellor.id, CareerCounsellor.first_name, CareerCounsellor.last_name,
+            CareerCounsellor.email, CareerCounsellor.specialization, CareerCounsellor.availability_status,
+            student_count.label('student_count')
+        ).outerjoin(student_counts, student_counts.c.counsellor_id == CareerCounsellor.id)
+        if request.args.get('available') == '1':
+            query = query.filter(CareerCounsellor.availability_status == True)
+        sorts = dict(COUNSELLOR_SORTS, students=(student_count,))
+        rows, page = table_page(query, CareerCounsellor, sorts)
+        
+        return jsonify(dict(page, counsellors=[{
+            'id': row.id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'email': row.email,
+            'specialization': row.specialization,
+            'availability_status': bool(row.availability_status),
+            'student_count': row.student_count
+        } for row in rows]))
+    except Exception:
+        current_app.logger.exception('Error listing counsellors')
+        return jsonify({'error': 'Failed to load counsellors'}), 500
+
+@admin_bp.route('/api/admin/analytics')
+@login_required
+@admin_required
+def analytics():
+    """
+    Daily trend series read from the daily_rollups table only. ?days=N (default
+    30) or ?start=YYYY-MM-DD&end=YYYY-MM-DD; ?metric= may be repeated to filter.
+    """
+    try:
+        max_days = current_app.config.get('ANALYTICS_MAX_DAYS', 365)
+        try:
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else datetime.now().date()
+            if request.args.get('start'):
+                start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+            else:
+                start = end - timedelta(days=request.args.get('days', 30, type=int) - 1)
+        except ValueError:
+            return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+        if start > end:
+            return jsonify({'error': 'start must not be after end'}), 400
+        start = max(start, end - timedelta(days=max_days - 1))
+        
+        query = DailyRollup.query.filter(DailyRollup.day >= start, DailyRollup.day <= end)
+        metrics = request.args.getlist('metric')
+        if metrics:
+            query = query.filter(DailyRollup.metric.in_(metrics))
+        
+        series = {}
+        totals = {}
+        for rollup in query.order_by(DailyRollup.metric, DailyRollup.dimension, DailyRollup.day):
+            point = {'day': rollup.day.isoformat(), 'count': rollup.value_count}
+            if rollup.value_sum is not None:
+                point['average'] = round(float(rollup.value_sum) / rollup.value_count, 2) if rollup.value_count else None
+            series.setdefault(rollup.metric, {}).setdefault(rollup.dimension, []).append(point)
+            totals.setdefault(rollup.metric, {}).setdefault(rollup.dimension, 0)
+            totals[rollup.metric][rollup.dimension] += rollup.value_count
+        
+        last_computed = db.session.query(func.max(DailyRollup.computed_at)).scalar()
+        
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'last_computed': last_computed.isoformat() if last_computed else None,
+            'series': series,
+            'totals': totals
+        })
+    except Exception:
+        current_app.logger.exception('Error loading analytics')
+        return jsonify({'error': 'Failed to load analytics'}), 500
+
 @admin_bp.route('/api/admin/reassign-counsellor', methods=['POST'])
 @login_required
 @admin_required
@@ -173,20 +379,13 @@ def reassign_counsellor():
 @login_required
 @admin_required
 def notifications():
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    
+    try:
+        notifications = notification_page('admin', current_user.id, limit=20)
+    except ValueError:
+        return redirect(url_for('admin.notifications'))
     
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id,
-        read_status=False
-    ).count()
     
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    unread_notifications = Notification.unread_count('admin', current_user.id)
     
     notification_icons = {
         'appointment': 'fa-calendar-check',
@@ -212,15 +411,13 @@ def mark_notifications_read():
         
         notification = Notification.query.filter_by(
             notification_id=notification_id,
-            user_id=current_user.id
+            user_id=current_user.id,
+            user_type='admin'
         ).first_or_404()
         notification.read_status = True
     else:
         
-        Notification.query.filter_by(
-            user_id=current_user.id,
-            read_status=False
-        ).update({'read_status': True})
+        Notification.mark_all_read('admin', current_user.id)
     
     db.session.commit()
     return jsonify({'success': True})
@@ -300,7 +497,7 @@ def delete_student(student_id):
         Grievance.query.filter_by(student_id=student_id).delete()
         
         
-        Notification.query.filter_by(user_id=student_id).delete()
+        Notification.query.filter_by(user_id=student_id, user_type='student').delete()
         
         
         goals = CareerGoal.query.filter_by(student_id=student_id).all()
@@ -346,10 +543,12 @@ def toggle_student_status(student_id):
                 (Message.sender_id == student.id) | 
                 (Message.recipient_id == student.id)
             ).delete()
+            Conversation.query.filter_by(student_id=student.id).delete()
             
             
             notifications_deleted = Notification.query.filter_by(
-                user_id=student.id
+                user_id=student.id,
+                user_type='student'
             ).delete()
             
             
@@ -442,30 +641,41 @@ def toggle_counsellor_status(counsellor_id):
                 return redirect(url_for('admin.dashboard'))
             
             
-            students_count = Student.query.filter_by(counsellor_id=counsellor_id).count()
+            reassigned_students = db.select(Student.id).where(Student.counsellor_id == counsellor_id)
+            Notification.fan_out(
+                'student',
+                reassigned_students,
+                f'Your counsellor has been changed to {new_counsellor.first_name} {new_counsellor.last_name} as your previous counsellor is no longer available.',
+                'general',
+                new_counsellor_id
+            )
             
             
-            update_result = Student.query.filter_by(counsellor_id=counsellor_id).update({'counsellor_id': new_counsellor_id})
+            students_count = Student.query.filter_by(counsellor_id=counsellor_id).update({'counsellor_id': new_counsellor_id})
             
             
-            future_appointments = Appointment.query.filter(
+            future_appointments = db.session.query(
+                Appointment.id,
+                Appointment.student_id,
+                Appointment.appointment_date
+            ).filter(
                 Appointment.counsellor_id == counsellor_id,
                 Appointment.appointment_date >= datetime.now().date(),
                 Appointment.status == 'scheduled'
             ).all()
             
-            for appointment in future_appointments:
-                
-                notification = Notification(
-                    user_id=appointment.student_id,
-                    message=f'Your appointment on {appointment.appointment_date} has been reassigned to {new_counsellor.first_name} {new_counsellor.last_name} due to counsellor unavailability.',
-                    notification_type='appointment',
-                    related_entity_id=appointment.id
-                )
-                db.session.add(notification)
-                
-                
-                appointment.counsellor_id = new_counsellor_id
+            Notification.insert_many([{
+                'user_id': appointment.student_id,
+                'user_type': 'student',
+                'message': f'Your appointment on {appointment.appointment_date} has been reassigned to {new_counsellor.first_name} {new_counsellor.last_name} due to counsellor unavailability.',
+                'notification_type': 'appointment',
+                'related_entity_id': appointment.id
+            } for appointment in future_appointments])
+            
+            if future_appointments:
+                Appointment.query.filter(
+                    Appointment.id.in_([appointment.id for appointment in future_appointments])
+                ).update({'counsellor_id': new_counsellor_id}, synchronize_session=False)
             
             
             pending_requests_count = AppointmentRequest.query.filter_by(
@@ -477,23 +687,13 @@ def toggle_counsellor_status(counsellor_id):
             
             new_counsellor_notification = Notification(
                 user_id=new_counsellor_id,
+                user_type='counsellor',
                 message=f'You have been assigned {students_count} students and {len(future_appointments)} appointments from {counsellor.first_name} {counsellor.last_name} who is now unavailable.',
                 notification_type='general',
                 related_entity_id=counsellor_id
             )
             db.session.add(new_counsellor_notification)
             
-            
-            reassigned_students = Student.query.filter_by(counsellor_id=new_counsellor_id).all()
-            for student in reassigned_students:
-                student_notification = Notification(
-                    user_id=student.id,
-                    message=f'Your counsellor has been changed to {new_counsellor.first_name} {new_counsellor.last_name} as your previous counsellor is no longer available.',
-                    notification_type='general',
-                    related_entity_id=new_counsellor_id
-                )
-                db.session.add(student_notification)
-            
             success_message = f'Counsellor {counsellor.first_name} {counsellor.last_name} has been deactivated. '
             success_message += f'Transferred {students_count} students, {len(future_appointments)} appointments, '
             success_message += f'and {pending_requests_count} pending requests to {new_counsellor.first_name} {new_counsellor.last_name}.'
@@ -625,20 +825,13 @@ def delete_event(event_id):
         
         try:
             
-            registrations = EventRegistration.query.filter_by(event_id=event_id).all()
-            
-            
-            registered_students = []
-            for registration in registrations:
-                notification = Notification(
-                    user_id=registration.student_id,
-                    user_type='student',
-                    message=f'Event "{event.title}" scheduled for {event.event_date.strftime("%B %d, %Y")} has been cancelled.',
-                    notification_type='event',
-                    related_entity_id=event_id
-                )
-                db.session.add(notification)
-                registered_students.append(registration.student_id)
+            Notification.fan_out(
+                'student',
+                db.select(EventRegistration.student_id).where(EventRegistration.event_id == event_id),
+                f'Event "{event.title}" scheduled for {event.event_date.strftime("%B %d, %Y")} has been cancelled.',
+                'event',
+                event_id
+            )
             
             
             deleted_registrations = EventRegistration.query.filter_by(event_id=event_id).delete()
@@ -738,6 +931,14 @@ def handle_appointment_request(request_id, action):
         request = AppointmentRequest.query.get_or_404(request_id)
         
         if action == 'approve':
+            try:
+                end_time = check_slot(request.counsellor_id, request.preferred_date, request.preferred_time)
+            except SlotUnavailable as e:
+                flash(e.message(
+                    past='Cannot approve a request for a past date',
+                    booked='The counsellor already has an appointment at this time'
+                ), 'danger')
+                return redirect(url_for('admin.dashboard'))
            
             request.status = 'approved'
             
@@ -747,7 +948,7 @@ def handle_appointment_request(request_id, action):
                 counsellor_id=request.counsellor_id,
                 appointment_date=request.preferred_date,
                 start_time=request.preferred_time,
-                end_time=(datetime.combine(request.preferred_date, request.preferred_time) + timedelta(hours=1)).time(),
+                end_time=end_time,
                 appointment_type=request.appointment_type,
                 mode=request.mode,
                 status='scheduled'
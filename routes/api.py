@@ -1,32 +1,88 @@
-from flask import request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
-from models.message import Message
-from models.student import Student
+from models import db, Message, Conversation, Student, Notification
+from routes.messages import CHAT_USER_TYPES, current_user_key, decode_cursor
+from availability import free_slots, appointment_duration
+from sqlalchemy import func
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+NotificationPage = namedtuple('NotificationPage', 'items has_older has_newer before_cursor after_cursor')
+
+
+def notification_page(user_type, user_id, limit=None):
+    """
+    Read before/after/limit from the query string and fetch that page of the
+    user's notification feed. Raises ValueError for a malformed cursor.
+    """
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if limit is None:
+        limit = request.args.get('limit', current_app.config.get('NOTIFICATION_PAGE_SIZE', 20), type=int)
+    limit = max(1, min(limit, current_app.config.get('NOTIFICATION_PAGE_SIZE_MAX', 100)))
+    
+    notifications, has_more = Notification.feed(
+        user_type,
+        user_id,
+        before=decode_cursor(before) if before else None,
+        after=decode_cursor(after) if after else None,
+        limit=limit
+    )
+    return NotificationPage(
+        items=notifications,
+        has_older=has_more if not after else True,
+        has_newer=has_more if after else bool(before),
+        before_cursor=notifications[-1].cursor if notifications else None,
+        after_cursor=notifications[0].cursor if notifications else None
+    )
+
+def can_message(user_type, user_id, partner_type, partner_id):
+    if user_type not in CHAT_USER_TYPES:
+        return False
+    if user_type == 'student':
+        return partner_type == 'counsellor' and current_user.counsellor_id == partner_id
+    return partner_type == 'student' and db.session.query(Student.id).filter_by(
+        id=partner_id,
+        counsellor_id=user_id
+    ).first() is not None
 
 @api_bp.route('/messages/conversation/<string:partner_type>/<int:partner_id>/new')
 @login_required
 def check_new_messages(partner_type, partner_id):
     try:
         after_id = request.args.get('after', 0, type=int)
-        
-        
-        user_type = 'student' if isinstance(current_user, Student) else 'counsellor'
-        user_id = int(current_user.get_id().split('-')[1])
-        
-        
+        limit = request.args.get('limit', current_app.config.get('MESSAGE_PAGE_SIZE', 50), type=int)
+        limit = min(max(limit, 1), current_app.config.get('MESSAGE_PAGE_SIZE_MAX', 200))
+        user_type, user_id = current_user_key()
+
+        if not can_message(user_type, user_id, partner_type, partner_id):
+            return jsonify({'error': 'You can only message your assigned contacts'}), 403
+
+        # The usual answer, "nothing new", comes from the conversation's primary key.
+        conversation = db.session.get(Conversation, Conversation.key_for(user_type, user_id, partner_id))
+        if conversation is None or (conversation.last_message_id or 0) <= after_id:
+            return jsonify({'hasNew': False, 'has_more': False, 'last_id': after_id})
+
         new_messages = Message.query.filter(
-            Message.id > after_id,
-            ((Message.sender_type == partner_type) & (Message.sender_id == partner_id) &
-             (Message.recipient_type == user_type) & (Message.recipient_id == user_id)) |
-            ((Message.sender_type == user_type) & (Message.sender_id == user_id) &
-             (Message.recipient_type == partner_type) & (Message.recipient_id == partner_id))
-        ).order_by(Message.sent_at.asc()).all()
-        
+            Message.message_id > after_id,
+            Message.between(user_type, user_id, partner_type, partner_id)
+        ).order_by(Message.message_id.asc()).limit(limit + 1).all()
+        has_more = len(new_messages) > limit
+        new_messages = new_messages[:limit]
+
+        if not new_messages:
+            return jsonify({'hasNew': False, 'has_more': False, 'last_id': after_id})
+
         return jsonify({
-            'hasNew': len(new_messages) > 0,
+            'hasNew': True,
+            'has_more': has_more,
+            'last_id': new_messages[-1].message_id,
             'messages': [message.to_dict() for message in new_messages]
         })
-        
+
     except Exception as e:
         return jsonify({
             'error': 'Failed to check for new messages'
@@ -36,26 +92,145 @@ def check_new_messages(partner_type, partner_id):
 @login_required
 def check_all_new_messages():
     try:
-        
-        last_message = Message.query.filter(
-            (Message.sender_id == current_user.id) | 
-            (Message.recipient_id == current_user.id)
-        ).order_by(Message.timestamp.desc()).first()
-        
-        
-        unread_count = Message.query.filter_by(
-            recipient_id=current_user.id,
-            read_status=False
-        ).count()
-        
+        user_type, user_id = current_user_key()
+        if user_type not in CHAT_USER_TYPES:
+            return jsonify({'success': False, 'error': 'Only students and counsellors have messages'}), 403
+
+        if user_type == 'student':
+            conversation = db.session.get(Conversation, (user_id, current_user.counsellor_id)) if current_user.counsellor_id else None
+            last_message_id = conversation.last_message_id if conversation else None
+            unread_count = conversation.student_unread if conversation else 0
+        else:
+            last_message_id, unread_count = db.session.query(
+                func.max(Conversation.last_message_id),
+                func.coalesce(func.sum(Conversation.counsellor_unread), 0)
+            ).filter(Conversation.counsellor_id == user_id).one()
+
         return jsonify({
             'success': True,
-            'last_message_time': last_message.timestamp.isoformat() if last_message else None,
-            'unread_count': unread_count
+            'last_message_id': last_message_id,
+            'unread_count': int(unread_count)
         })
-        
+
     except Exception as e:
         return jsonify({
             'success': False,
             'error': 'Failed to check new messages'
-        }), 500 
\ No newline at end of file
+        }), 500
+
+@api_bp.route('/notifications/feed')
+@login_required
+def notification_feed():
+    user_type, user_id = current_user_key()
+    try:
+        page = notification_page(user_type, user_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'notifications': [notification.to_dict() for notification in page.items],
+        'has_older': page.has_older,
+        'has_newer': page.has_newer,
+        'before_cursor': page.before_cursor,
+        'after_cursor': page.after_cursor,
+        'unread_count': Notification.unread_count(user_type, user_id)
+    })
+
+@api_bp.route('/notifications')
+@login_required
+def list_notifications():
+    user_type, user_id = current_user_key()
+    # The validator is read from the database, not this worker's cache, so a
+    # change committed by another worker is never answered with a 304.
+    latest_id, unread_count = Notification.inbox_state(user_type, user_id, cached=False)
+    etag = f'{user_type}-{user_id}-{latest_id}-{unread_count}'
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        notifications, _ = Notification.feed(
+            user_type,
+            user_id,
+            limit=current_app.config.get('NOTIFICATION_PAGE_SIZE', 20)
+        )
+        response = jsonify([notification.to_dict() for notification in notifications])
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api_bp.route('/notifications/<int:notification_id>/read', methods=['PUT'])
+@login_required
+def read_notification(notification_id):
+    user_type, user_id = current_user_key()
+    try:
+        notification = Notification.query.filter_by(
+            notification_id=notification_id,
+            user_type=user_type,
+            user_id=user_id
+        ).first()
+        if not notification:
+            return jsonify({'success': False, 'error': 'Notification not found'}), 404
+        
+        notification.read_status = True
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Failed to mark notification as read'}), 500
+
+@api_bp.route('/notifications/mark-all-read', methods=['PUT'])
+@login_required
+def read_all_notifications():
+    user_type, user_id = current_user_key()
+    try:
+        Notification.mark_all_read(user_type, user_id)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Failed to mark notifications as read'}), 500
+
+@api_bp.route('/availability')
+@login_required
+def availability():
+    """
+    Free appointment slots for a counsellor between ?start and ?end
+    (YYYY-MM-DD, default the next 14 days). Students get their own
+    counsellor, counsellors themselves; admins pass ?counsellor_id.
+    """
+    user_type, user_id = current_user_key()
+    if user_type == 'student':
+        counsellor_id = current_user.counsellor_id
+        if not counsellor_id:
+            return jsonify({'error': 'You need to be assigned a counsellor first.'}), 400
+    elif user_type == 'counsellor':
+        counsellor_id = user_id
+    else:
+        counsellor_id = request.args.get('counsellor_id', type=int)
+        if not counsellor_id:
+            return jsonify({'error': 'counsellor_id is required'}), 400
+    
+    try:
+        today = datetime.now().date()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else today
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else start + timedelta(days=13)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    start = max(start, today)
+    end = min(end, start + timedelta(days=current_app.config.get('AVAILABILITY_MAX_DAYS', 31) - 1))
+    if end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+    
+    slots = free_slots(counsellor_id, start, end)
+    return jsonify({
+        'counsellor_id': counsellor_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'slot_minutes': int(appointment_duration().total_seconds() // 60),
+        'days': [{
+            'date': day.isoformat(),
+            'day_of_week': day.strftime('%A'),
+            'slots': [slot.strftime('%H:%M') for slot in day_slots]
+        } for day, day_slots in sorted(slots.items())]
+    })
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from models import CareerCounsellor, db, CounsellorSchedule, Student, Appointment, AppointmentRequest, Administrator, Notification, Task
-from datetime import datetime, timedelta
+from models import CareerCounsellor, db, CounsellorSchedule, Student, Appointment, AppointmentRequest, Administrator, Notification, NotificationOutbox, Task
+from fragments import data_version
+from availability import check_slot, SlotUnavailable
+from datetime import datetime
 from functools import wraps
 from werkzeug.utils import secure_filename
 import os
@@ -10,6 +12,13 @@ import string
 
 counsellor_bp = Blueprint('counsellor', __name__, url_prefix='/counsellor')
 
+# SlotUnavailable wording when the counsellor is booking their own calendar.
+OWN_SLOT_MESSAGES = {
+    'day_off': 'You are not available on {day:%A}s',
+    'outside_hours': 'Selected time is outside your working hours',
+    'booked': 'This time slot is already booked'
+}
+
 def counsellor_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -101,30 +110,23 @@ def dashboard():
     counsellor_id = int(current_user.get_id().split('-')[1])
     
     
-    stats = {
-        'total_students': Student.query.filter_by(counsellor_id=counsellor_id).count(),
-        'upcoming_appointments': Appointment.query.filter(
-            Appointment.counsellor_id == counsellor_id,
-            Appointment.appointment_date >= datetime.now().date(),
-            Appointment.status == 'scheduled'
-        ).count(),
-        'pending_requests': AppointmentRequest.query.filter_by(
-            counsellor_id=counsellor_id,
-            status='pending'
-        ).count()
-    }
+    stats = CareerCounsellor.dashboard_stats(counsellor_id)
     
     
     upcoming_appointments = Appointment.query.filter(
         Appointment.counsellor_id == counsellor_id,
         Appointment.appointment_date >= datetime.now().date(),
         Appointment.status == 'scheduled'
+    ).options(
+        db.joinedload(Appointment.student)
     ).order_by(Appointment.appointment_date, Appointment.start_time).all()
     
     
     appointment_requests = AppointmentRequest.query.filter_by(
         counsellor_id=counsellor_id,
         status='pending'
+    ).options(
+        db.joinedload(AppointmentRequest.student)
     ).order_by(AppointmentRequest.preferred_date).all()
     
     
@@ -141,13 +143,12 @@ def dashboard():
     
     assigned_tasks = Task.query.join(Student).filter(
         Student.counsellor_id == counsellor_id
+    ).options(
+        db.contains_eager(Task.student)
     ).order_by(Task.due_date.asc()).all()
     
 
-    unread_notifications = Notification.query.filter_by(
-        user_id=counsellor_id,
-        read_status=False
-    ).count()
+    unread_notifications = Notification.unread_count('counsellor', counsellor_id)
     
     return render_template('counsellor/dashboard.html',
                          counsellor=current_user,
@@ -157,7 +158,8 @@ def dashboard():
                          assigned_students=assigned_students,
                          schedule=schedule,
                          assigned_tasks=assigned_tasks,
-                         unread_notifications=unread_notifications)
+                         unread_notifications=unread_notifications,
+                         modal_version=data_version(assigned_students, schedule))
 
 @counsellor_bp.route('/appointments/schedule', methods=['POST'])
 @login_required
@@ -214,62 +216,14 @@ def schedule_appointment():
             }), 400
 
         
-        if appointment_date < datetime.now().date():
-            print(f"Past date validation failed: {appointment_date} < {datetime.now().date()}")
-            return jsonify({
-                'success': False,
-                'message': 'Cannot schedule appointments in the past'
-            }), 400
-
-        
-        end_time = (datetime.combine(datetime.min, start_time) + timedelta(hours=1)).time()
-        print(f"Calculated end time: {end_time}")
-
-        
-        day_of_week = appointment_date.strftime('%A')
-        print(f"Checking schedule for {day_of_week}")
-        
-        counsellor_schedule = CounsellorSchedule.query.filter_by(
-            counsellor_id=current_user.id,
-            day_of_week=day_of_week
-        ).first()
-
-        if not counsellor_schedule:
-            print(f"No schedule found for {day_of_week}")
-            return jsonify({
-                'success': False,
-                'message': f'You are not available on {day_of_week}s'
-            }), 400
-
-        print("Found counsellor schedule:", {
-            'start_time': counsellor_schedule.start_time,
-            'end_time': counsellor_schedule.end_time
-        })
-
-        
-        if (start_time < counsellor_schedule.start_time or 
-            end_time > counsellor_schedule.end_time):
-            print(f"Time validation failed: start={start_time}, end={end_time}")
-            print(f"Working hours: {counsellor_schedule.start_time} - {counsellor_schedule.end_time}")
-            return jsonify({
-                'success': False,
-                'message': 'Selected time is outside your working hours'
-            }), 400
-
-        
-        print("Checking for existing appointments")
-        existing_appointment = Appointment.query.filter_by(
-            counsellor_id=current_user.id,
-            appointment_date=appointment_date,
-            start_time=start_time,
-            status='scheduled'
-        ).first()
-
-        if existing_appointment:
-            print(f"Found conflicting appointment: {existing_appointment.id}")
+        print(f"Checking availability for {appointment_date} at {start_time}")
+        try:
+            end_time = check_slot(current_user.id, appointment_date, start_time)
+        except SlotUnavailable as e:
+            print(f"Slot unavailable: {e.reason}")
             return jsonify({
                 'success': False,
-                'message': 'This time slot is already booked'
+                'message': e.message(**OWN_SLOT_MESSAGES)
             }), 400
 
         print("Creating new appointment")
@@ -358,7 +312,14 @@ def approve_request(request_id):
         print(f"Request details: date={request.preferred_date}, time={request.preferred_time}, student={request.student_id}")
         
         
-        end_time = (datetime.combine(datetime.min, request.preferred_time) + timedelta(hours=1)).time()
+        try:
+            end_time = check_slot(counsellor_id, request.preferred_date, request.preferred_time)
+        except SlotUnavailable as e:
+            print(f"Slot unavailable: {e.reason}")
+            return jsonify({
+                'success': False,
+                'message': e.message(**OWN_SLOT_MESSAGES, past='Cannot approve a request for a past date')
+            }), 400
         
         
         appointment = Appointment(
@@ -385,24 +346,8 @@ def approve_request(request_id):
         request.updated_at = datetime.now()
         
         
-        notification = Notification(
-            user_id=request.student_id,
-            user_type='student',
-            message=f'Your appointment request for {request.preferred_date.strftime("%B %d, %Y")} at {request.preferred_time.strftime("%I:%M %p")} has been approved.',
-            notification_type='appointment',
-            related_entity_id=appointment.id
-        )
-        db.session.add(notification)
-        
-        
-        counsellor_notification = Notification(
-            user_id=counsellor_id,
-            user_type='counsellor',
-            message=f'You have approved the appointment request for {request.preferred_date.strftime("%B %d, %Y")} at {request.preferred_time.strftime("%I:%M %p")}',
-            notification_type='appointment',
-            related_entity_id=appointment.id
-        )
-        db.session.add(counsellor_notification)
+        db.session.flush()
+        NotificationOutbox.enqueue('appointment_approved', request_id=request.id, appointment_id=appointment.id)
         
         
         db.session.commit()
@@ -633,10 +578,7 @@ def load_notifications():
         counsellor_id = int(current_user.get_id().split('-')[1])
         
         
-        notifications = Notification.query.filter_by(
-            user_id=counsellor_id,
-            user_type='counsellor'
-        ).order_by(Notification.created_at.desc()).limit(10).all()
+        notifications, _ = Notification.feed('counsellor', counsellor_id, limit=10)
         
         
         formatted_notifications = [{
@@ -684,11 +626,7 @@ def mark_all_notifications_read():
         counsellor_id = int(current_user.get_id().split('-')[1])
         
         
-        Notification.query.filter_by(
-            user_id=counsellor_id,
-            user_type='counsellor',
-            read_status=False
-        ).update({'read_status': True})
+        Notification.mark_all_read('counsellor', counsellor_id)
         
         db.session.commit()
         
@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template
-from models import Event
+from models import db, Event
 from datetime import datetime
 
 
@@ -18,6 +18,8 @@ def events():
     
     upcoming_events = Event.query.filter(
         Event.event_date >= datetime.now().date()
+    ).options(
+        db.undefer(Event.registered_count)
     ).order_by(Event.event_date, Event.start_time).all()
     
     return render_template('events.html', 
@@ -1,16 +1,92 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, current_app
 from flask_login import login_required, current_user
-from models import db, Message, Student, CareerCounsellor
+from models import db, Message, MessageArchive, Conversation, Student, CareerCounsellor
+from realtime import message_hub, format_sse
+from search import search_messages
+from sqlalchemy import and_, or_
 from datetime import datetime
+import queue
 
 messages_bp = Blueprint('messages', __name__)
 
+# Chat runs between students and counsellors; administrators have no inbox.
+CHAT_USER_TYPES = ('student', 'counsellor')
+
+
+def current_user_key():
+    """The logged-in user's (user_type, user_id), e.g. ('admin', 1) for 'admin-1'."""
+    user_type, user_id = current_user.get_id().split('-')
+    return user_type, int(user_id)
+
+
+def encode_cursor(message):
+    return f"{message.sent_at.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{message.message_id}"
+
+def decode_cursor(cursor):
+    """Split a cursor into its (sent_at, message_id) key. Raises ValueError when malformed."""
+    sent_at, _, message_id = cursor.rpartition('_')
+    return datetime.strptime(sent_at, '%Y-%m-%dT%H:%M:%S.%f'), int(message_id)
+
+def conversation_page(model, user_type, user_id, partner_type, partner_id, before=None, after=None, limit=50):
+    """Fetch up to limit rows of one conversation from model, walking away from the given cursor key."""
+    query = model.query.filter(model.between(user_type, user_id, partner_type, partner_id))
+    
+    if after:
+        sent_at, message_id = after
+        return query.filter(or_(
+            model.sent_at > sent_at,
+            and_(model.sent_at == sent_at, model.message_id > message_id)
+        )).order_by(model.sent_at.asc(), model.message_id.asc()).limit(limit).all()
+    
+    if before:
+        sent_at, message_id = before
+        query = query.filter(or_(
+            model.sent_at < sent_at,
+            and_(model.sent_at == sent_at, model.message_id < message_id)
+        ))
+    return query.order_by(model.sent_at.desc(), model.message_id.desc()).limit(limit).all()
+
+def paginate_conversation(user_type, user_id, partner_type, partner_id, before=None, after=None, limit=None):
+    """
+    Keyset pagination over (sent_at, message_id) for one conversation.
+    Without a cursor the newest page is returned. Messages are always returned
+    oldest first, together with a flag telling whether more exist in the
+    direction that was paged. The archive is only read for threads that have
+    archived messages, once paging runs past what the hot table holds.
+    """
+    max_limit = current_app.config.get('MESSAGE_PAGE_SIZE_MAX', 200)
+    limit = min(max(limit or current_app.config.get('MESSAGE_PAGE_SIZE', 50), 1), max_limit)
+    participants = (user_type, user_id, partner_type, partner_id)
+    archived_at = Conversation.archived_at_for(*participants)
+    
+    if after:
+        after = decode_cursor(after)
+        messages = []
+        if archived_at and after[0] <= archived_at:
+            messages = conversation_page(MessageArchive, *participants, after=after, limit=limit + 1)
+        if len(messages) <= limit:
+            hot_after = (messages[-1].sent_at, messages[-1].message_id) if messages else after
+            messages += conversation_page(Message, *participants, after=hot_after, limit=limit + 1 - len(messages))
+        return messages[:limit], len(messages) > limit
+    
+    before = decode_cursor(before) if before else None
+    messages = conversation_page(Message, *participants, before=before, limit=limit + 1)
+    if len(messages) <= limit and archived_at:
+        archive_before = (messages[-1].sent_at, messages[-1].message_id) if messages else before
+        messages += conversation_page(MessageArchive, *participants, before=archive_before, limit=limit + 1 - len(messages))
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, has_more
+
 @messages_bp.route('/api/messages/conversation/<recipient_type>/<int:recipient_id>', methods=['GET'])
 @login_required
 def get_conversation(recipient_type, recipient_id):
     
-    sender_type = 'student' if current_user.get_id().startswith('student-') else 'counsellor'
-    sender_id = int(current_user.get_id().split('-')[1])
+    sender_type, sender_id = current_user_key()
+    if sender_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
     
     
     if sender_type == 'student':
@@ -22,29 +98,75 @@ def get_conversation(recipient_type, recipient_id):
             return jsonify({'error': 'You can only message your assigned students'}), 403
     
     
-    messages = Message.query.filter(
-        (
-            (Message.sender_id == sender_id) & 
-            (Message.sender_type == sender_type) & 
-            (Message.recipient_id == recipient_id) & 
-            (Message.recipient_type == recipient_type)
-        ) |
-        (
-            (Message.sender_id == recipient_id) & 
-            (Message.sender_type == recipient_type) & 
-            (Message.recipient_id == sender_id) & 
-            (Message.recipient_type == sender_type)
+    try:
+        messages, has_more = paginate_conversation(
+            sender_type, sender_id, recipient_type, recipient_id,
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            limit=request.args.get('limit', type=int)
         )
-    ).order_by(Message.sent_at.asc()).all()
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     
-    unread_messages = [m for m in messages if not m.is_read and m.recipient_id == sender_id]
-    for message in unread_messages:
-        message.is_read = True
-    if unread_messages:
+    data = [message.to_dict() for message in messages]
+    unread_ids = [m['message_id'] for m in data if not m['is_read'] and m['recipient_type'] == sender_type]
+    if unread_ids:
+        Message.mark_conversation_read(sender_type, sender_id, recipient_type, recipient_id, max(unread_ids))
         db.session.commit()
+        message_hub.publish_read(sender_type, sender_id, recipient_type, recipient_id, max(unread_ids))
+        for m in data:
+            if m['message_id'] in unread_ids:
+                m['is_read'] = True
+    
+    response = jsonify(data)
+    response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    if messages:
+        response.headers['X-Before-Cursor'] = encode_cursor(messages[0])
+        response.headers['X-After-Cursor'] = encode_cursor(messages[-1])
+    return response
+
+def post_message(sender_type, sender_id, recipient_type, recipient_id, message_text):
+    """Store a message, update its conversation and push it to both participants."""
+    message = Message(
+        sender_id=sender_id,
+        sender_type=sender_type,
+        recipient_id=recipient_id,
+        recipient_type=recipient_type,
+        message_text=message_text,
+        sent_at=datetime.utcnow(),
+        is_read=False
+    )
     
-    return jsonify([message.to_dict() for message in messages])
+    db.session.add(message)
+    db.session.flush()
+    Conversation.record_message(message)
+    db.session.commit()
+    message_hub.publish_message(message)
+    return message
+
+@messages_bp.route('/api/messages/conversation/<recipient_type>/<int:recipient_id>/read', methods=['POST'])
+@login_required
+def mark_conversation_read(recipient_type, recipient_id):
+    data = request.get_json(silent=True) or {}
+    up_to = data.get('up_to')
+    
+    if not isinstance(up_to, int):
+        return jsonify({'error': 'up_to must be the highest message id the client has seen'}), 400
+    
+    user_type, user_id = current_user_key()
+    if user_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
+    
+    try:
+        updated = Message.mark_conversation_read(user_type, user_id, recipient_type, recipient_id, up_to)
+        if updated:
+            db.session.commit()
+            message_hub.publish_read(user_type, user_id, recipient_type, recipient_id, up_to)
+        return jsonify({'success': True, 'marked_read': updated})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to mark conversation as read'}), 500
 
 @messages_bp.route('/api/messages/send', methods=['POST'])
 @login_required
@@ -52,8 +174,9 @@ def send_message():
     data = request.get_json()
     
     
-    sender_type = 'student' if current_user.get_id().startswith('student-') else 'counsellor'
-    sender_id = int(current_user.get_id().split('-')[1])
+    sender_type, sender_id = current_user_key()
+    if sender_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
     recipient_id = data.get('recipient_id')
     recipient_type = data.get('recipient_type')
     
@@ -71,121 +194,182 @@ def send_message():
             return jsonify({'error': 'You can only message your assigned students'}), 403
     
     
-    message = Message(
-        sender_id=sender_id,
-        sender_type=sender_type,
-        recipient_id=recipient_id,
-        recipient_type=recipient_type,
-        message_text=data.get('message'),
-        sent_at=datetime.utcnow(),
-        is_read=False
-    )
-    
-    db.session.add(message)
-    db.session.commit()
+    message = post_message(sender_type, sender_id, recipient_type, recipient_id, data.get('message'))
     
     return jsonify(message.to_dict())
 
+@messages_bp.route('/api/messages/broadcast', methods=['POST'])
+@login_required
+def broadcast_message():
+    if not current_user.get_id().startswith('counsellor-'):
+        return jsonify({'error': 'Only counsellors can broadcast messages'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    message_text = (data.get('message') or '').strip()
+    if not message_text:
+        return jsonify({'error': 'Message text is required'}), 400
+    
+    counsellor_id = int(current_user.get_id().split('-')[1])
+    student_ids = [row.id for row in db.session.query(Student.id).filter_by(
+        counsellor_id=counsellor_id,
+        is_active=True
+    )]
+    if not student_ids:
+        return jsonify({'error': 'You have no assigned students'}), 400
+    
+    try:
+        sent_at = datetime.utcnow()
+        messages = [Message(
+            sender_id=counsellor_id,
+            sender_type='counsellor',
+            recipient_id=student_id,
+            recipient_type='student',
+            message_text=message_text,
+            sent_at=sent_at,
+            is_read=False
+        ) for student_id in student_ids]
+        
+        # The flush assigns each message its own id; nothing is re-read by id range.
+        db.session.add_all(messages)
+        db.session.flush()
+        
+        Conversation.record_broadcast(counsellor_id, messages)
+        payloads = [message.to_dict() for message in messages]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to broadcast message'}), 500
+    
+    for payload in payloads:
+        message_hub.publish('student', payload['recipient_id'], 'message', payload)
+    # One event for the sender, however many students were reached.
+    message_hub.publish('counsellor', counsellor_id, 'broadcast', {'messages': payloads})
+    
+    return jsonify({'success': True, 'recipients': len(payloads)})
+
+@messages_bp.route('/api/messages/stream', methods=['GET'])
+@login_required
+def stream_messages():
+    
+    user_type, user_id = current_user_key()
+    if user_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
+    keepalive = current_app.config.get('MESSAGE_STREAM_KEEPALIVE', 15)
+    
+    subscription = message_hub.subscribe(user_type, user_id)
+    
+    def event_stream():
+        try:
+            yield format_sse({'user_type': user_type, 'user_id': user_id}, event='ready')
+            while True:
+                try:
+                    event, data = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(data, event=event)
+        finally:
+            message_hub.unsubscribe(user_type, user_id, subscription)
+    
+    return Response(event_stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @messages_bp.route('/api/messages/conversations', methods=['GET'])
 @login_required
 def get_conversations():
     
-    user_type = 'student' if current_user.get_id().startswith('student-') else 'counsellor'
-    user_id = int(current_user.get_id().split('-')[1])
+    user_type, user_id = current_user_key()
+    if user_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
     
     if user_type == 'student':
         
         if not current_user.counsellor_id:
             return jsonify([])
-            
-        messages = Message.query.filter(
-            (
-                (Message.sender_id == user_id) & 
-                (Message.sender_type == 'student') & 
-                (Message.recipient_id == current_user.counsellor_id) &
-                (Message.recipient_type == 'counsellor')
-            ) |
-            (
-                (Message.sender_id == current_user.counsellor_id) & 
-                (Message.sender_type == 'counsellor') &
-                (Message.recipient_id == user_id) &
-                (Message.recipient_type == 'student')
-            )
-        ).order_by(Message.sent_at.desc()).all()
+        partner_type = 'counsellor'
+        rows = db.session.query(
+            Conversation.counsellor_id.label('partner_id'),
+            Conversation.student_unread.label('unread_count'),
+            CareerCounsellor.first_name,
+            CareerCounsellor.last_name,
+            Message,
+            MessageArchive
+        ).join(
+            CareerCounsellor, CareerCounsellor.id == Conversation.counsellor_id
+        ).outerjoin(
+            Message, Message.message_id == Conversation.last_message_id
+        ).outerjoin(
+            MessageArchive, MessageArchive.message_id == Conversation.last_message_id
+        ).filter(
+            Conversation.student_id == user_id,
+            Conversation.counsellor_id == current_user.counsellor_id
+        ).all()
     else:
+        partner_type = 'student'
+        rows = db.session.query(
+            Conversation.student_id.label('partner_id'),
+            Conversation.counsellor_unread.label('unread_count'),
+            Student.first_name,
+            Student.last_name,
+            Message,
+            MessageArchive
+        ).join(
+            Student, Student.id == Conversation.student_id
+        ).outerjoin(
+            Message, Message.message_id == Conversation.last_message_id
+        ).outerjoin(
+            MessageArchive, MessageArchive.message_id == Conversation.last_message_id
+        ).filter(
+            Conversation.counsellor_id == user_id,
+            Student.counsellor_id == user_id
+        ).order_by(Conversation.last_message_id.desc()).all()
+    
+    
+    return jsonify([{
+        'id': row.partner_id,
+        'type': partner_type,
+        'name': f"{row.first_name} {row.last_name}",
+        'last_message': (row.Message or row.MessageArchive).to_dict(),
+        'unread_count': row.unread_count
+    } for row in rows if row.Message or row.MessageArchive])
+
+@messages_bp.route('/api/messages/search', methods=['GET'])
+@login_required
+def search_message_history():
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'error': 'Search query must be at least 2 characters'}), 400
+    
+    user_type, user_id = current_user_key()
+    if user_type not in CHAT_USER_TYPES:
+        return jsonify({'error': 'Only students and counsellors can message'}), 403
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config.get('MESSAGE_SEARCH_PAGE_SIZE', 20)
+    
+    try:
         
-        assigned_students = Student.query.filter_by(counsellor_id=user_id).with_entities(Student.id).all()
-        student_ids = [s.id for s in assigned_students]
-        
-        if not student_ids:
-            return jsonify([])
-            
-        messages = Message.query.filter(
-            (
-                (Message.sender_id == user_id) & 
-                (Message.sender_type == 'counsellor') & 
-                (Message.recipient_id.in_(student_ids)) &
-                (Message.recipient_type == 'student')
-            ) |
-            (
-                (Message.sender_id.in_(student_ids)) & 
-                (Message.sender_type == 'student') &
-                (Message.recipient_id == user_id) &
-                (Message.recipient_type == 'counsellor')
-            )
-        ).order_by(Message.sent_at.desc()).all()
-    
-    
-    conversations = {}
-    for message in messages:
-        if message.sender_id == user_id:
-            
-            if (user_type == 'student' and message.recipient_type != 'counsellor') or \
-               (user_type == 'counsellor' and message.recipient_type != 'student'):
-                continue
-            partner_id = message.recipient_id
-            partner_type = message.recipient_type
-        else:
-            
-            if (user_type == 'student' and message.sender_type != 'counsellor') or \
-               (user_type == 'counsellor' and message.sender_type != 'student'):
-                continue
-            partner_id = message.sender_id
-            partner_type = message.sender_type
-            
-        if (partner_type, partner_id) not in conversations:
-            
-            if partner_type == 'student':
-                partner = Student.query.get(partner_id)
-                if partner:
-                    conversations[(partner_type, partner_id)] = {
-                        'id': partner_id,
-                        'type': partner_type,
-                        'name': f"{partner.first_name} {partner.last_name}",
-                        'last_message': message.to_dict(),
-                        'unread_count': Message.query.filter_by(
-                            sender_id=partner_id,
-                            sender_type=partner_type,
-                            recipient_id=user_id,
-                            recipient_type=user_type,
-                            is_read=False
-                        ).count()
-                    }
-            else:
-                partner = CareerCounsellor.query.get(partner_id)
-                if partner:
-                    conversations[(partner_type, partner_id)] = {
-                        'id': partner_id,
-                        'type': partner_type,
-                        'name': f"{partner.first_name} {partner.last_name}",
-                        'last_message': message.to_dict(),
-                        'unread_count': Message.query.filter_by(
-                            sender_id=partner_id,
-                            sender_type=partner_type,
-                            recipient_id=user_id,
-                            recipient_type=user_type,
-                            is_read=False
-                        ).count()
-                    }
-    
-    return jsonify(list(conversations.values())) 
\ No newline at end of file
+        results = search_messages(user_type, user_id, query, limit=per_page + 1, offset=(page - 1) * per_page)
+    except NotImplementedError as e:
+        return jsonify({'error': str(e)}), 501
+    
+    hits = []
+    for message, score, snippet in results[:per_page]:
+        sent_by_me = message.sender_type == user_type and message.sender_id == user_id
+        hits.append({
+            'message': message.to_dict(),
+            'partner_id': message.recipient_id if sent_by_me else message.sender_id,
+            'partner_type': message.recipient_type if sent_by_me else message.sender_type,
+            'score': score,
+            'snippet': snippet
+        })
+    
+    return jsonify({
+        'query': query,
+        'page': page,
+        'has_more': len(results) > per_page,
+        'results': hits
+    })
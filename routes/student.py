@@ -1,13 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
-from models import Student, db, Notification, CareerGoal, GoalMilestone, Task, StudentDocument, Grievance, Event, EventRegistration, Message, Appointment, CounsellorSchedule, CareerCounsellor, AppointmentRequest, Feedback
+from models import student_dashboards, Student, db, Notification, CareerGoal, GoalMilestone, Task, StudentDocument, Grievance, Event, EventRegistration, Message, Appointment, CounsellorSchedule, CareerCounsellor, AppointmentRequest, Feedback, NotificationOutbox
 from datetime import datetime, timedelta, time
 from sqlalchemy import desc, func
 from werkzeug.utils import secure_filename
 import os
 import uuid
 from functools import wraps
+from realtime import message_hub
+from cache import snapshot
+from routes.messages import paginate_conversation, encode_cursor, post_message
+from routes.api import notification_page
+from availability import check_slot, SlotUnavailable
 
 
 student_bp = Blueprint('student', __name__)
@@ -279,10 +284,7 @@ def manage_milestones(goal_id):
         return redirect(url_for('student.manage_milestones', goal_id=goal_id))
     
     
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id,
-        read_status=False
-    ).count()
+    unread_notifications = Notification.unread_count('student', current_user.id)
     
     milestones = GoalMilestone.query.filter_by(goal_id=goal_id).order_by(GoalMilestone.due_date.asc()).all()
     return render_template('student/milestones.html', 
@@ -548,6 +550,8 @@ def view_events():
     
     upcoming_events = Event.query.filter(
         Event.event_date >= datetime.now().date()
+    ).options(
+        db.undefer(Event.registered_count)
     ).order_by(Event.event_date.asc()).all()
     
     
@@ -565,6 +569,7 @@ def view_events():
             'location': event.location,
             'is_online': event.is_online,
             'capacity': event.capacity,
+            'registered_count': event.registered_count,
             'registration': bool(registrations.get(event.event_id))
         } for event in upcoming_events]
     })
@@ -588,9 +593,7 @@ def register_for_event(event_id):
     
     
     if event.capacity is not None:
-        current_registrations = EventRegistration.query.filter_by(event_id=event_id).count()
-        
-        if current_registrations >= event.capacity:
+        if event.registered_count >= event.capacity:
             return jsonify({'error': 'Event is at full capacity'}), 400
     else:
         pass
@@ -648,16 +651,7 @@ def messages():
         
         try:
             
-            message = Message(
-                sender_id=current_user.id,
-                recipient_id=current_user.counsellor_id,
-                sender_type='student',
-                recipient_type='counsellor',
-                message_text=message_text,
-                sent_at=datetime.now()
-            )
-            db.session.add(message)
-            db.session.commit()
+            message = post_message('student', current_user.id, 'counsellor', current_user.counsellor_id, message_text)
             
             return jsonify({
                 'message': 'Message sent successfully',
@@ -675,29 +669,42 @@ def messages():
             return jsonify({'error': 'Failed to send message'}), 500
     
     
-    conversation = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.recipient_id == current_user.counsellor_id)) |
-        ((Message.sender_id == current_user.counsellor_id) & (Message.recipient_id == current_user.id))
-    ).order_by(Message.sent_at.desc()).all()
-    
-    
-    unread_messages = [msg for msg in conversation if not msg.is_read and msg.recipient_id == current_user.id]
-    for msg in unread_messages:
-        msg.is_read = True
-    if unread_messages:
+    try:
+        conversation, has_more = paginate_conversation(
+            'student', current_user.id, 'counsellor', current_user.counsellor_id,
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            limit=request.args.get('limit', type=int)
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    conversation.reverse()
+    
+    
+    unread_ids = {msg.message_id for msg in conversation if not msg.is_read and msg.recipient_type == 'student'}
+    messages_data = [{
+        'id': msg.message_id,
+        'sender_id': msg.sender_id,
+        'recipient_id': msg.recipient_id,
+        'message_text': msg.message_text,
+        'sent_at': msg.sent_at.isoformat(),
+        'is_read': msg.is_read or msg.message_id in unread_ids,
+        'is_sent_by_me': msg.sender_type == 'student'
+    } for msg in conversation]
+    before_cursor = encode_cursor(conversation[-1]) if conversation else None
+    after_cursor = encode_cursor(conversation[0]) if conversation else None
+    
+    if unread_ids:
+        Message.mark_conversation_read('student', current_user.id, 'counsellor', current_user.counsellor_id, max(unread_ids))
         db.session.commit()
+        message_hub.publish_read('student', current_user.id, 'counsellor', current_user.counsellor_id, max(unread_ids))
     
     return jsonify({
         'counsellor_id': current_user.counsellor_id,
-        'messages': [{
-            'id': msg.message_id,
-            'sender_id': msg.sender_id,
-            'recipient_id': msg.recipient_id,
-            'message_text': msg.message_text,
-            'sent_at': msg.sent_at.isoformat(),
-            'is_read': msg.is_read,
-            'is_sent_by_me': msg.sender_id == current_user.id
-        } for msg in conversation]
+        'has_more': has_more,
+        'before_cursor': before_cursor,
+        'after_cursor': after_cursor,
+        'messages': messages_data
     })
 
 @student_bp.route('/student/submit_grievance', methods=['POST'])
@@ -773,52 +780,14 @@ def request_appointment():
         preferred_time = datetime.strptime(start_time, '%H:%M').time()
         
         
-        end_time = (datetime.combine(datetime.min, preferred_time) + timedelta(hours=1)).time()
-        
-        
-        if preferred_date < datetime.now().date():
-            return jsonify({
-                'status': 'error',
-                'message': 'Cannot schedule appointments in the past'
-            }), 400
-            
-        
-        day_of_week = preferred_date.strftime('%A')
-        
-        counsellor_schedule = CounsellorSchedule.query.filter_by(
-            counsellor_id=counsellor_id,
-            day_of_week=day_of_week
-        ).first()
-        
-        if not counsellor_schedule:
-            return jsonify({
-                'status': 'error',
-                'message': f'Counsellor is not available on {day_of_week}'
-            }), 400
-            
-        
-        if (preferred_time < counsellor_schedule.start_time or 
-            end_time > counsellor_schedule.end_time):
-            return jsonify({
-                'status': 'error',
-                'message': 'Selected time is outside counsellor\'s working hours'
-            }), 400
-            
-        
-        existing_appointment = Appointment.query.filter_by(
-            counsellor_id=counsellor_id,
-            appointment_date=preferred_date,
-            start_time=preferred_time,
-            status='scheduled'
-        ).first()
-        
-        if existing_appointment:
+        try:
+            check_slot(counsellor_id, preferred_date, preferred_time, include_requests=True)
+        except SlotUnavailable as e:
             return jsonify({
                 'status': 'error',
-                'message': 'This time slot is already booked. Please choose another time.'
+                'message': e.message()
             }), 400
         
-        
         appointment_request = AppointmentRequest(
             student_id=student_id,
             counsellor_id=counsellor_id,
@@ -831,29 +800,8 @@ def request_appointment():
         )
         
         db.session.add(appointment_request)
-        db.session.commit()  
-        
-        
-        counsellor_notification = Notification(
-            user_id=counsellor_id,
-            user_type='counsellor',
-            message=f'New appointment request from {current_user.first_name} {current_user.last_name} for {preferred_date.strftime("%B %d, %Y")} at {preferred_time.strftime("%I:%M %p")}',
-            notification_type='appointment',
-            related_entity_id=appointment_request.id,
-            created_at=datetime.now()
-        )
-        db.session.add(counsellor_notification)
-        
-        
-        student_notification = Notification(
-            user_id=student_id,
-            user_type='student',
-            message=f'Your appointment request for {preferred_date.strftime("%B %d, %Y")} at {preferred_time.strftime("%I:%M %p")} has been submitted.',
-            notification_type='appointment',
-            related_entity_id=appointment_request.id,
-            created_at=datetime.now()
-        )
-        db.session.add(student_notification)
+        db.session.flush()
+        NotificationOutbox.enqueue('appointment_requested', request_id=appointment_request.id)
         
         db.session.commit()
         
@@ -893,96 +841,109 @@ def dashboard():
         return redirect(url_for('auth.login'))
 
     
-    career_goals = CareerGoal.query.filter_by(student_id=current_user.id).all()
+    today = datetime.now().date()
+    generation = student_dashboards.generation(current_user.id)
+    view = student_dashboards.get(current_user.id)
+    if view is None or view['date'] != today:
+        view = build_dashboard(current_user, today)
+        student_dashboards.set(current_user.id, view, generation=generation)
+
+    
+    unread_notifications = Notification.unread_count('student', current_user.id)
+
+    return render_template('student/dashboard.html',
+                         unread_notifications=unread_notifications,
+                         dashboard_version=view['version'],
+                         **view['context'])
+
+def build_dashboard(student, today):
+    """
+    Load everything the student dashboard shows as plain snapshots, so the
+    result can be cached across requests without holding session-bound objects.
+    """
+    career_goals = CareerGoal.query.filter_by(student_id=student.id).all()
+    milestones = {}
+    if career_goals:
+        for milestone in GoalMilestone.query.filter(
+            GoalMilestone.goal_id.in_([goal.goal_id for goal in career_goals])
+        ).order_by(GoalMilestone.due_date, GoalMilestone.milestone_id):
+            milestones.setdefault(milestone.goal_id, []).append(snapshot(milestone))
     
     
+    counsellor = None
     counsellor_schedule = None
-    if current_user.counsellor_id:
+    if student.counsellor_id:
+        counsellor = snapshot(student.counsellor, exclude=('password_hash',)) if student.counsellor else None
         counsellor_schedule = CounsellorSchedule.query.filter_by(
-            counsellor_id=current_user.counsellor_id
+            counsellor_id=student.counsellor_id
         ).order_by(CounsellorSchedule.day_of_week).all()
 
     
     upcoming_appointments = Appointment.query.filter(
-        Appointment.student_id == current_user.id,
-        Appointment.appointment_date >= datetime.now().date(),
+        Appointment.student_id == student.id,
+        Appointment.appointment_date >= today,
         Appointment.status == 'scheduled'
     ).order_by(Appointment.appointment_date, Appointment.start_time).all()
 
     
     pending_requests = AppointmentRequest.query.filter_by(
-        student_id=current_user.id,
+        student_id=student.id,
         status='pending'
     ).all()
 
     
     recent_grievances = Grievance.query.filter_by(
-        student_id=current_user.id
+        student_id=student.id
     ).order_by(Grievance.created_at.desc()).limit(5).all()
 
     
     upcoming_events = Event.query.filter(
-        Event.event_date >= datetime.now().date()
+        Event.event_date >= today
     ).order_by(Event.event_date, Event.start_time).all()
 
     
-    student_registrations = EventRegistration.query.filter_by(
-        student_id=current_user.id
-    ).all()
-    
-    
-    event_registrations = {reg.event_id: reg for reg in student_registrations}
-
-    
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id,
-        read_status=False
-    ).count()
+    event_registrations = {reg.event_id: snapshot(reg) for reg in EventRegistration.query.filter_by(
+        student_id=student.id
+    )}
 
     
     recent_feedback = Feedback.query.filter_by(
-        student_id=current_user.id
+        student_id=student.id
     ).order_by(Feedback.created_at.desc()).limit(5).all()
 
     
     assigned_tasks = Task.query.filter_by(
-        student_id=current_user.id
+        student_id=student.id
     ).order_by(Task.due_date.asc()).all()
 
-    return render_template('student/dashboard.html',
-                         student=current_user,
-                         career_goals=career_goals,
-                         counsellor_schedule=counsellor_schedule,
-                         upcoming_appointments=upcoming_appointments,
-                         pending_requests=pending_requests,
-                         recent_grievances=recent_grievances,
-                         upcoming_events=upcoming_events,
-                         event_registrations=event_registrations,
-                         unread_notifications=unread_notifications,
-                         recent_feedback=recent_feedback,
-                         assigned_tasks=assigned_tasks)
+    return {
+        'date': today,
+        'version': uuid.uuid4().hex,
+        'context': {
+            'student': snapshot(student, exclude=('password_hash',), counsellor=counsellor),
+            'career_goals': [snapshot(goal, milestones=milestones.get(goal.goal_id, [])) for goal in career_goals],
+            'counsellor_schedule': [snapshot(day) for day in counsellor_schedule] if counsellor_schedule is not None else None,
+            'upcoming_appointments': [snapshot(appointment) for appointment in upcoming_appointments],
+            'pending_requests': [snapshot(request) for request in pending_requests],
+            'recent_grievances': [snapshot(grievance) for grievance in recent_grievances],
+            'upcoming_events': [snapshot(event, exclude=('registered_count',)) for event in upcoming_events],
+            'event_registrations': event_registrations,
+            'recent_feedback': [snapshot(feedback) for feedback in recent_feedback],
+            'assigned_tasks': [snapshot(task) for task in assigned_tasks]
+        }
+    }
 
 @student_bp.route('/student/notifications')
 @login_required
 def notifications():
     
-    page = request.args.get('page', 1, type=int)
-    per_page = 10  
-    
-
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    try:
+        notifications = notification_page('student', current_user.id, limit=10)
+    except ValueError:
+        return redirect(url_for('student.notifications'))
     
     
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id,
-        read_status=False
-    ).count()
+    unread_count = Notification.unread_count('student', current_user.id)
     
     return render_template('student/notifications.html', 
                          notifications=notifications,
@@ -993,7 +954,8 @@ def notifications():
 def mark_notification_read(notification_id):
     notification = Notification.query.filter_by(
         notification_id=notification_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        user_type='student'
     ).first_or_404()
     
     notification.read_status = True
@@ -1004,10 +966,7 @@ def mark_notification_read(notification_id):
 @student_bp.route('/student/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
-    Notification.query.filter_by(
-        user_id=current_user.id,
-        read_status=False
-    ).update({'read_status': True})
+    Notification.mark_all_read('student', current_user.id)
     
     db.session.commit()
     
@@ -1017,9 +976,7 @@ def mark_all_notifications_read():
 @login_required
 def load_notifications():
     
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).limit(5).all()
+    notifications, _ = Notification.feed('student', current_user.id, limit=5)
     
     return jsonify({
         'notifications': [{
@@ -1087,42 +1044,15 @@ def reschedule_appointment(appointment_id):
             new_time = datetime.strptime(new_time, '%H:%M').time()
             
             
-            if new_date < datetime.now().date():
-                flash('Cannot schedule appointments in the past', 'danger')
-                return redirect(url_for('student.dashboard'))
-            
-            
-            new_end_time = (datetime.combine(datetime.min, new_time) + timedelta(hours=1)).time()
-            
-            
-            day_of_week = new_date.strftime('%A')
-            counselor_schedule = CounsellorSchedule.query.filter_by(
-                counselor_id=appointment.counselor_id,
-                day_of_week=day_of_week
-            ).first()
-            
-            if not counselor_schedule:
-                flash('Counselor is not available on this day.', 'danger')
-                return redirect(url_for('student.dashboard'))
-            
-            if (new_time < counselor_schedule.start_time or 
-                new_end_time > counselor_schedule.end_time):
-                flash('Selected time is outside counselor\'s working hours.', 'danger')
-                return redirect(url_for('student.dashboard'))
-            
-            
-            existing_appointment = Appointment.query.filter_by(
-                counselor_id=appointment.counselor_id,
-                appointment_date=new_date,
-                start_time=new_time,
-                status='scheduled'
-            ).first()
-            
-            if existing_appointment and existing_appointment.id != appointment_id:
-                flash('This time slot is already booked. Please choose another time.', 'danger')
+            try:
+                new_end_time = check_slot(
+                    appointment.counsellor_id, new_date, new_time,
+                    include_requests=True, exclude_appointment_id=appointment.id
+                )
+            except SlotUnavailable as e:
+                flash(e.message(), 'danger')
                 return redirect(url_for('student.dashboard'))
             
-            
             appointment.appointment_date = new_date
             appointment.start_time = new_time
             appointment.end_time = new_end_time
@@ -1131,13 +1061,15 @@ def reschedule_appointment(appointment_id):
             
             student_notification = Notification(
                 user_id=current_user.id,
+                user_type='student',
                 message=f'Your appointment has been rescheduled to {new_date.strftime("%B %d, %Y")} at {new_time.strftime("%I:%M %p")}',
                 notification_type='appointment',
                 related_entity_id=appointment.id
             )
             
             counselor_notification = Notification(
-                user_id=appointment.counselor_id,
+                user_id=appointment.counsellor_id,
+                user_type='counsellor',
                 message=f'Appointment with {current_user.first_name} {current_user.last_name} has been rescheduled to {new_date.strftime("%B %d, %Y")} at {new_time.strftime("%I:%M %p")}',
                 notification_type='appointment',
                 related_entity_id=appointment.id
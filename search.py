@@ -0,0 +1,135 @@
+from sqlalchemy import DDL, event, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models import db, Message
+
+
+# MySQL answers MATCH ... AGAINST from a FULLTEXT index on the messages table.
+# SQLite (used for local development) gets an external-content FTS5 table kept
+# in sync by triggers, so both backends search an index instead of the table.
+MYSQL_INDEX_DDL = 'ALTER TABLE messages ADD FULLTEXT INDEX ft_messages_text (message_text)'
+
+SQLITE_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "message_text, content='messages', content_rowid='message_id')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, message_text) VALUES (new.message_id, new.message_text); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, message_text) VALUES ('delete', old.message_id, old.message_text); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message_text ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, message_text) VALUES ('delete', old.message_id, old.message_text); "
+    "INSERT INTO messages_fts(rowid, message_text) VALUES (new.message_id, new.message_text); END",
+)
+
+event.listen(Message.__table__, 'after_create', DDL(MYSQL_INDEX_DDL).execute_if(dialect='mysql'))
+for statement in SQLITE_INDEX_DDL:
+    event.listen(Message.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+class SearchIndexMissing(NotImplementedError):
+    """The messages table predates the search index; 'flask upgrade-db' builds it."""
+
+
+def search_index_exists():
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        return any(index['name'] == 'ft_messages_text' for index in db.inspect(db.engine).get_indexes('messages'))
+    if dialect == 'sqlite':
+        return db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first() is not None
+    return False
+
+
+def ensure_search_index():
+    """
+    Build the search index for a messages table created before it existed,
+    indexing the rows already there. Returns True if anything was built.
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in ('mysql', 'sqlite') or search_index_exists():
+        return False
+    if dialect == 'mysql':
+        db.session.execute(text(MYSQL_INDEX_DDL))
+    else:
+        for statement in SQLITE_INDEX_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    return True
+
+
+SCOPE_SQL = (
+    '((m.sender_type = :user_type AND m.sender_id = :user_id) OR '
+    '(m.recipient_type = :user_type AND m.recipient_id = :user_id))'
+)
+
+
+def make_snippet(message_text, terms, width=60):
+    lowered = message_text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width, 0) if positions else 0
+    end = min(start + width * 2, len(message_text))
+    snippet = message_text[start:end]
+    if start > 0:
+        snippet = '...' + snippet
+    if end < len(message_text):
+        snippet = snippet + '...'
+    return snippet
+
+
+def search_messages(user_type, user_id, query, limit, offset):
+    """
+    Ranked full-text search over the messages the user sent or received.
+    Returns a list of (Message, score, snippet) tuples, best match first.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    params = {'user_type': user_type, 'user_id': user_id, 'limit': limit, 'offset': offset}
+
+    try:
+        if dialect == 'mysql':
+            params['query'] = query
+            rows = db.session.execute(text(
+                'SELECT m.message_id, MATCH(m.message_text) AGAINST (:query IN NATURAL LANGUAGE MODE) AS score '
+                'FROM messages m '
+                'WHERE MATCH(m.message_text) AGAINST (:query IN NATURAL LANGUAGE MODE) AND ' + SCOPE_SQL + ' '
+                'ORDER BY score DESC, m.message_id DESC LIMIT :limit OFFSET :offset'
+            ), params).all()
+            snippets = {}
+        elif dialect == 'sqlite':
+            params['query'] = ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+            rows = db.session.execute(text(
+                "SELECT m.message_id, -bm25(messages_fts) AS score, "
+                "snippet(messages_fts, 0, '', '', '...', 16) AS snippet "
+                'FROM messages_fts JOIN messages m ON m.message_id = messages_fts.rowid '
+                'WHERE messages_fts MATCH :query AND ' + SCOPE_SQL + ' '
+                'ORDER BY score DESC, m.message_id DESC LIMIT :limit OFFSET :offset'
+            ), params).all()
+            snippets = {row.message_id: row.snippet for row in rows}
+        else:
+            raise NotImplementedError(f'Full-text search is not available on {dialect}')
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        if search_index_exists():
+            raise
+        raise SearchIndexMissing('Message search index has not been built yet; run "flask upgrade-db"')
+
+    if not rows:
+        return []
+
+    messages = {m.message_id: m for m in Message.query.filter(
+        Message.message_id.in_([row.message_id for row in rows])
+    ).all()}
+
+    results = []
+    for row in rows:
+        message = messages.get(row.message_id)
+        if message is None:
+            continue
+        snippet = snippets.get(row.message_id) or make_snippet(message.message_text, terms)
+        results.append((message, float(row.score), snippet))
+    return results
@@ -0,0 +1,202 @@
+// Admin student/counsellor tables. Each page is fetched from the server on
+// demand, so the HTML no longer grows with the number of users.
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value == null ? '' : String(value);
+    return div.innerHTML;
+}
+
+function createAdminTable(container, options) {
+    const state = {page: 1, q: '', sort: Object.keys(options.sorts)[0], order: 'asc'};
+    let controller = null;
+    let searchTimer = null;
+
+    container.innerHTML = `
+        <div class="admin-table-controls d-flex mb-2">
+            <input type="search" class="form-control admin-table-search" placeholder="Search by name or email">
+            <select class="form-control admin-table-sort">
+                ${Object.entries(options.sorts).map(([key, label]) => `<option value="${key}">Sort by ${label}</option>`).join('')}
+            </select>
+            <button type="button" class="btn-action admin-table-order" title="Toggle sort order">
+                <i class="fas fa-sort-amount-down-alt"></i>
+            </button>
+        </div>
+        <div class="admin-table-rows ${options.listClass || ''}"></div>
+        <div class="admin-table-pager d-flex justify-content-between align-items-center mt-2">
+            <button type="button" class="btn-action admin-table-prev">Previous</button>
+            <small class="text-muted admin-table-status"></small>
+            <button type="button" class="btn-action admin-table-next">Next</button>
+        </div>`;
+
+    const rows = container.querySelector('.admin-table-rows');
+    const status = container.querySelector('.admin-table-status');
+    const prev = container.querySelector('.admin-table-prev');
+    const next = container.querySelector('.admin-table-next');
+    const orderButton = container.querySelector('.admin-table-order');
+
+    async function load() {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        const params = new URLSearchParams({
+            page: state.page,
+            per_page: options.perPage || 20,
+            sort: state.sort,
+            order: state.order
+        });
+        if (state.q) params.set('q', state.q);
+
+        try {
+            const response = await fetch(`${options.url}?${params}`, {signal: controller.signal});
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || 'Failed to load');
+
+            const items = data[options.listKey];
+            rows.innerHTML = items.length
+                ? items.map(options.renderRow).join('')
+                : `<p class="text-muted">${options.emptyText || 'Nothing found'}</p>`;
+            if (options.afterRender) options.afterRender(rows, items);
+
+            const first = (data.page - 1) * data.per_page + 1;
+            status.textContent = items.length
+                ? `${first}-${first + items.length - 1} of ${data.total}`
+                : `0 of ${data.total}`;
+            prev.disabled = data.page <= 1;
+            next.disabled = !data.has_more;
+        } catch (error) {
+            if (error.name === 'AbortError') return;
+            console.error('Error:', error);
+            rows.innerHTML = '<p class="text-muted">Failed to load</p>';
+        }
+    }
+
+    container.querySelector('.admin-table-search').addEventListener('input', (e) => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            state.q = e.target.value.trim();
+            state.page = 1;
+            load();
+        }, 250);
+    });
+    container.querySelector('.admin-table-sort').addEventListener('change', (e) => {
+        state.sort = e.target.value;
+        state.page = 1;
+        load();
+    });
+    orderButton.addEventListener('click', () => {
+        state.order = state.order === 'asc' ? 'desc' : 'asc';
+        orderButton.querySelector('i').className = state.order === 'asc'
+            ? 'fas fa-sort-amount-down-alt'
+            : 'fas fa-sort-amount-down';
+        state.page = 1;
+        load();
+    });
+    prev.addEventListener('click', () => { state.page -= 1; load(); });
+    next.addEventListener('click', () => { state.page += 1; load(); });
+
+    load();
+    return {reload: load};
+}
+
+// Available counsellors for the reassignment picker, fetched once per page view.
+let counsellorOptionsPromise = null;
+
+function loadCounsellorOptions() {
+    if (!counsellorOptionsPromise) {
+        counsellorOptionsPromise = (async () => {
+            const counsellors = [];
+            for (let page = 1; ; page++) {
+                const response = await fetch(`/admin/api/admin/counsellors?available=1&per_page=100&page=${page}`);
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error || 'Failed to load counsellors');
+                counsellors.push(...data.counsellors);
+                if (!data.has_more) return counsellors;
+            }
+        })();
+        counsellorOptionsPromise.catch(() => { counsellorOptionsPromise = null; });
+    }
+    return counsellorOptionsPromise;
+}
+
+function renderStudentRow(student) {
+    const name = `${student.first_name} ${student.last_name || ''}`;
+    return `
+        <div class="student-item d-flex justify-content-between align-items-center mb-2">
+            <div>
+                <strong>${escapeHtml(name)}</strong>
+                <small class="d-block text-muted">${escapeHtml(student.email)}</small>
+                <small class="d-block">
+                    ${student.counsellor ? `<span class="badge badge-info">Counsellor: ${escapeHtml(student.counsellor.name)}</span>` : ''}
+                </small>
+            </div>
+            <div class="student-actions">
+                <form action="/admin/admin/student/${student.id}/reassign-counsellor" method="POST" style="display: inline;"
+                      class="reassign-counsellor-form" data-current-counsellor="${student.counsellor ? student.counsellor.id : ''}">
+                    <select name="new_counsellor_id" class="form-control mb-2" required>
+                        <option value="">Assign to counsellor...</option>
+                    </select>
+                    <button type="submit" class="btn-action btn-primary">
+                        <i class="fas fa-user-plus"></i>
+                        Assign
+                    </button>
+                </form>
+            </div>
+        </div>`;
+}
+
+function renderCounsellorRow(counsellor) {
+    const name = `${counsellor.first_name} ${counsellor.last_name || ''}`;
+    return `
+        <div class="counsellor-item d-flex justify-content-between align-items-center mb-2">
+            <div>
+                <strong>${escapeHtml(name)}</strong>
+                <small class="d-block text-muted">${escapeHtml(counsellor.email)}</small>
+                <small class="d-block">
+                    <span class="badge badge-info">
+                        Specialization: ${escapeHtml(counsellor.specialization || 'Not specified')}
+                    </span>
+                    <span class="badge badge-secondary">
+                        Students: ${counsellor.student_count}
+                    </span>
+                </small>
+            </div>
+        </div>`;
+}
+
+// Fill each row's picker from the shared counsellor list and submit reassignments over fetch.
+function bindReassignForms(rows, onDone) {
+    loadCounsellorOptions().then(counsellors => {
+        rows.querySelectorAll('.reassign-counsellor-form').forEach(form => {
+            const current = form.dataset.currentCounsellor;
+            form.querySelector('select').insertAdjacentHTML('beforeend', counsellors
+                .filter(counsellor => String(counsellor.id) !== current)
+                .map(counsellor => `<option value="${counsellor.id}">
+                    ${escapeHtml(`${counsellor.first_name} ${counsellor.last_name || ''}`)}
+                    (${escapeHtml(counsellor.specialization || 'No specialization')})
+                </option>`).join(''));
+        });
+    }).catch(error => console.error('Error:', error));
+
+    rows.querySelectorAll('.reassign-counsellor-form').forEach(form => {
+        form.addEventListener('submit', async function(e) {
+            e.preventDefault();
+            if (!confirm('Are you sure you want to reassign this student to the selected counsellor?')) {
+                return;
+            }
+
+            try {
+                const response = await fetch(this.action, {
+                    method: 'POST',
+                    body: new FormData(this)
+                });
+                if (response.ok) {
+                    onDone(true);
+                } else {
+                    onDone(false, await response.text());
+                }
+            } catch (error) {
+                console.error('Fetch error:', error);
+                onDone(false, error.message);
+            }
+        });
+    });
+}
@@ -0,0 +1,41 @@
+// Fill a time <select> with the counsellor's free slots for the date picked in
+// dateInput, from /api/availability, so students only pick bookable times.
+function bindSlotPicker(dateInput, timeSelect) {
+    function setOptions(options, disabled) {
+        timeSelect.innerHTML = options;
+        timeSelect.disabled = disabled;
+        timeSelect.dispatchEvent(new Event('change'));
+    }
+
+    async function load() {
+        const day = dateInput.value;
+        if (!day) {
+            setOptions('<option value="">Pick a date first</option>', true);
+            return;
+        }
+        setOptions('<option value="">Loading free times...</option>', true);
+
+        try {
+            const response = await fetch(`/api/availability?start=${day}&end=${day}`);
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || 'Failed to load availability');
+
+            const slots = data.days.length ? data.days[0].slots : [];
+            if (!slots.length) {
+                setOptions('<option value="">No free times on this day</option>', true);
+                return;
+            }
+            setOptions(slots.map(slot => {
+                const [hours, minutes] = slot.split(':').map(Number);
+                const label = `${hours % 12 || 12}:${String(minutes).padStart(2, '0')} ${hours < 12 ? 'AM' : 'PM'}`;
+                return `<option value="${slot}">${label}</option>`;
+            }).join(''), false);
+        } catch (error) {
+            console.error('Error:', error);
+            setOptions('<option value="">Could not load free times</option>', true);
+        }
+    }
+
+    dateInput.addEventListener('change', load);
+    load();
+}
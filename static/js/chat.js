@@ -0,0 +1,96 @@
+// One realtime connection per tab: the /ws/chat WebSocket gateway when the
+// server has it, otherwise the /api/messages/stream EventSource (receive only).
+function connectChat(handlers) {
+    const chat = {
+        socket: null,
+        onlineUsers: new Set(),
+        typingTimers: {},
+        lastTypingSent: 0
+    };
+    let retryDelay = 1000;
+    let pingTimer = null;
+
+    function dispatch(event, data) {
+        if (event === 'ready' || event === 'pong') {
+            chat.onlineUsers = new Set(data.online.map(u => `${u.user_type}-${u.user_id}`));
+        } else if (event === 'presence') {
+            const key = `${data.user_type}-${data.user_id}`;
+            data.online ? chat.onlineUsers.add(key) : chat.onlineUsers.delete(key);
+        } else if (event === 'error') {
+            console.error('Chat error:', data.error);
+        }
+        if (handlers[event]) handlers[event](data);
+    }
+
+    function useEventSource() {
+        if (!window.EventSource || chat.stream) return;
+        chat.stream = new EventSource('/api/messages/stream');
+        ['message', 'read', 'broadcast'].forEach(event => {
+            chat.stream.addEventListener(event, (e) => dispatch(event, JSON.parse(e.data)));
+        });
+    }
+
+    function openSocket() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws/chat`);
+        let opened = false;
+
+        socket.addEventListener('open', () => {
+            opened = true;
+            retryDelay = 1000;
+            chat.socket = socket;
+        });
+        socket.addEventListener('message', (e) => {
+            const frame = JSON.parse(e.data);
+            if (frame.event === 'ready') {
+                clearInterval(pingTimer);
+                pingTimer = setInterval(() => chat.send({type: 'ping'}), frame.data.presence_ttl * 1000 / 3);
+            }
+            dispatch(frame.event, frame.data);
+        });
+        socket.addEventListener('close', () => {
+            chat.socket = null;
+            clearInterval(pingTimer);
+            if (!opened) {
+                // The server has no WebSocket gateway; stay on the SSE stream.
+                useEventSource();
+                return;
+            }
+            setTimeout(openSocket, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        });
+    }
+
+    // Returns false when the frame could not go over the socket, so callers can fall back to HTTP.
+    chat.send = function(frame) {
+        if (!chat.socket || chat.socket.readyState !== WebSocket.OPEN) return false;
+        chat.socket.send(JSON.stringify(frame));
+        return true;
+    };
+
+    chat.sendTyping = function(partnerType, partnerId) {
+        const now = Date.now();
+        if (now - chat.lastTypingSent < 3000) return;
+        chat.lastTypingSent = now;
+        chat.send({type: 'typing', partner_type: partnerType, partner_id: parseInt(partnerId), typing: true});
+    };
+
+    chat.isOnline = function(userType, userId) {
+        return chat.onlineUsers.has(`${userType}-${userId}`);
+    };
+
+    if (window.WebSocket) {
+        openSocket();
+    } else {
+        useEventSource();
+    }
+    return chat;
+}
+
+// Show "typing..." for a few seconds after a typing event, then fall back to presence.
+function showTypingIndicator(chat, element, data, render) {
+    const key = `${data.user_type}-${data.user_id}`;
+    clearTimeout(chat.typingTimers[key]);
+    element.textContent = 'typing...';
+    chat.typingTimers[key] = setTimeout(render, 4000);
+}
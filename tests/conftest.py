@@ -0,0 +1,84 @@
+import logging
+import os
+import sys
+import tempfile
+from datetime import time
+
+import pytest
+
+# The app reads its database URI at import time, so point it at a throwaway
+# SQLite file before anything imports config.
+DB_DIR = tempfile.mkdtemp(prefix='career-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DB_DIR, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from fragments import fragment_cache  # noqa: E402
+from models import (  # noqa: E402
+    db, Administrator, CareerCounsellor, CounsellorSchedule, Student,
+    counsellor_stats, notification_states, student_dashboards
+)
+from realtime import message_hub, presence  # noqa: E402
+
+logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
+logging.getLogger().setLevel(logging.WARNING)
+
+
+@pytest.fixture
+def app():
+    """
+    The application with a freshly created schema seeded with two counsellors,
+    three students assigned to the first one, an administrator and a Monday
+    9:00-17:00 schedule for the first counsellor. Every password is 'pw'.
+    """
+    flask_app.config.update(TESTING=True, OUTBOX_DISPATCHER_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+
+        counsellor = CareerCounsellor(email='c1@example.com', first_name='Casey', last_name='One',
+                                      specialization='Tech', rating=4)
+        other = CareerCounsellor(email='c2@example.com', first_name='Dana', last_name='Two',
+                                 specialization='Arts', rating=4)
+        for user in (counsellor, other):
+            user.set_password('pw')
+            db.session.add(user)
+        db.session.flush()
+
+        for i in range(3):
+            student = Student(email=f's{i}@example.com', first_name=f'Student{i}', last_name='Test',
+                              counsellor_id=counsellor.id)
+            student.set_password('pw')
+            db.session.add(student)
+        admin = Administrator(email='admin@example.com', first_name='Ada')
+        admin.set_password('pw')
+        db.session.add(admin)
+        db.session.add(CounsellorSchedule(counsellor_id=counsellor.id, day_of_week='Monday',
+                                          start_time=time(9), end_time=time(17)))
+        db.session.commit()
+
+        yield flask_app
+
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS messages_fts')
+
+    for cache in (counsellor_stats, student_dashboards, notification_states, fragment_cache):
+        cache.clear()
+    message_hub._subscribers.clear()
+    presence._last_seen.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Log the test client in as the user with the given email."""
+    def login(email):
+        response = client.post('/login', json={'email': email, 'password': 'pw'})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return client
+    return login
@@ -0,0 +1,84 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from jobs import rollup_daily
+from models import db, Appointment, DailyRollup, Feedback
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+
+
+@pytest.fixture
+def activity(app):
+    """Yesterday: two appointments (one completed) and two feedback ratings; today: the three seeded sign-ups."""
+    appointments = [
+        Appointment(student_id=student_id, counsellor_id=1, appointment_date=YESTERDAY, start_time=time(9 + student_id),
+                    appointment_type='Career', mode='online', status=status)
+        for student_id, status in ((1, 'completed'), (2, 'scheduled'))
+    ]
+    db.session.add_all(appointments)
+    db.session.add_all([
+        Feedback(student_id=student_id, counsellor_id=1, rating=rating,
+                 created_at=datetime.combine(YESTERDAY, time(18)))
+        for student_id, rating in ((1, 4), (2, 5))
+    ])
+    db.session.commit()
+    return appointments
+
+
+def rollups():
+    db.session.expire_all()
+    return {
+        (r.day, r.metric, r.dimension): (r.value_count, None if r.value_sum is None else float(r.value_sum))
+        for r in DailyRollup.query
+    }
+
+
+def test_rollup_counts_each_metric_by_day_and_dimension(activity):
+    assert rollup_daily(YESTERDAY, TODAY)[2] == len(rollups())
+
+    assert rollups() == {
+        (YESTERDAY, 'appointments', 'completed'): (1, None),
+        (YESTERDAY, 'appointments', 'scheduled'): (1, None),
+        (YESTERDAY, 'feedback', '1'): (2, 9.0),
+        (TODAY, 'new_students', 'all'): (3, None),
+    }
+
+
+def test_rerunning_a_rollup_replaces_its_rows(activity):
+    rollup_daily(YESTERDAY, TODAY)
+    first = rollups()
+
+    rollup_daily(YESTERDAY, TODAY)
+    assert rollups() == first
+
+    activity[1].status = 'cancelled'
+    db.session.commit()
+    rollup_daily(YESTERDAY, TODAY)
+
+    second = rollups()
+    assert (YESTERDAY, 'appointments', 'scheduled') not in second
+    assert second[YESTERDAY, 'appointments', 'cancelled'] == (1, None)
+    assert len(second) == len(first)
+
+
+def test_rollup_resumes_with_a_lookback(app, activity):
+    app.config['ANALYTICS_ROLLUP_LOOKBACK_DAYS'] = 2
+    rollup_daily(YESTERDAY, TODAY)
+
+    start, end, _ = rollup_daily()
+
+    assert (start, end) == (TODAY - timedelta(days=2), TODAY)
+    assert rollups()[YESTERDAY, 'feedback', '1'] == (2, 9.0)
+
+
+def test_analytics_reads_the_rollups(activity, login):
+    rollup_daily(YESTERDAY, TODAY)
+    client = login('admin@example.com')
+
+    data = client.get('/admin/api/admin/analytics', query_string={'days': 7, 'metric': 'feedback'}).get_json()
+
+    assert list(data['series']) == ['feedback']
+    assert data['series']['feedback']['1'] == [{'day': YESTERDAY.isoformat(), 'count': 2, 'average': 4.5}]
+    assert data['totals'] == {'feedback': {'1': 2}}
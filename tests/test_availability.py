@@ -0,0 +1,143 @@
+import random
+from datetime import date, time, timedelta
+
+import pytest
+
+from availability import IntervalIndex, SlotUnavailable, check_slot, free_slots
+from models import db, Appointment, AppointmentRequest
+
+
+def next_monday():
+    today = date.today()
+    return today + timedelta(days=7 - today.weekday())
+
+
+def book(day, start, end=None, status='scheduled'):
+    appointment = Appointment(student_id=1, counsellor_id=1, appointment_date=day, start_time=start,
+                              end_time=end, appointment_type='Career', mode='online', status=status)
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+
+def request_slot(day, start):
+    appointment_request = AppointmentRequest(student_id=2, counsellor_id=1, preferred_date=day,
+                                             preferred_time=start, appointment_type='Career', mode='online')
+    db.session.add(appointment_request)
+    db.session.commit()
+    return appointment_request
+
+
+def reason(*args, **kwargs):
+    with pytest.raises(SlotUnavailable) as excinfo:
+        check_slot(*args, **kwargs)
+    return excinfo.value.reason
+
+
+def test_conflict_on_empty_index():
+    assert IntervalIndex().conflict(9, 10) is None
+
+
+def test_conflict_treats_intervals_as_half_open():
+    index = IntervalIndex([(9, 10, 1)])
+
+    assert index.conflict(10, 11) is None
+    assert index.conflict(8, 9) is None
+    assert index.conflict(9, 10) == (9, 10, 1)
+    assert index.conflict(8, 12) == (9, 10, 1)
+    assert index.conflict(9.5, 9.75) == (9, 10, 1)
+
+
+def test_conflict_finds_long_booking_behind_short_ones():
+    index = IntervalIndex([(11, 11.5, 2), (9, 13, 1), (10, 10.5, 3)])
+
+    assert index.conflict(12, 12.5) == (9, 13, 1)
+    assert index.conflict(12, 12.5, exclude=1) is None
+    assert index.conflict(13, 14) is None
+
+
+def test_conflict_matches_brute_force():
+    rng = random.Random(25)
+    for _ in range(200):
+        intervals = []
+        for booking_id in range(rng.randint(0, 12)):
+            start = rng.randint(0, 40)
+            intervals.append((start, start + rng.randint(1, 10), booking_id))
+        index = IntervalIndex(intervals)
+        for _ in range(20):
+            start = rng.randint(0, 50)
+            end = start + rng.randint(1, 6)
+            exclude = rng.choice([None, 0, 1])
+            expected = {i for i in intervals if i[0] < end and i[1] > start and i[2] != exclude}
+            found = index.conflict(start, end, exclude)
+            assert (found is None) == (not expected)
+            assert found is None or found in expected
+
+
+def test_check_slot_rejects_unbookable_times(app):
+    monday = next_monday()
+
+    assert reason(1, monday - timedelta(days=7), time(10)) == 'past'
+    assert reason(1, monday + timedelta(days=1), time(10)) == 'day_off'
+    assert reason(1, monday, time(8, 30)) == 'outside_hours'
+    assert reason(1, monday, time(16, 30)) == 'outside_hours'
+    assert check_slot(1, monday, time(16)) == time(17)
+
+
+def test_check_slot_rejects_overlaps_but_not_neighbours(app):
+    monday = next_monday()
+    appointment = book(monday, time(10), time(11))
+    book(monday, time(14), time(15), status='cancelled')
+
+    assert reason(1, monday, time(10)) == 'booked'
+    assert reason(1, monday, time(9, 30)) == 'booked'
+    assert reason(1, monday, time(10, 30)) == 'booked'
+    assert check_slot(1, monday, time(9)) == time(10)
+    assert check_slot(1, monday, time(11)) == time(12)
+    assert check_slot(1, monday, time(10, 30), exclude_appointment_id=appointment.id) == time(11, 30)
+    assert check_slot(1, monday, time(14)) == time(15)
+
+
+def test_check_slot_assumes_default_length_without_end_time(app):
+    monday = next_monday()
+    book(monday, time(10))
+
+    assert reason(1, monday, time(10, 30)) == 'booked'
+    assert reason(1, monday, time(9, 30)) == 'booked'
+    assert check_slot(1, monday, time(11)) == time(12)
+    assert check_slot(1, monday, time(9)) == time(10)
+
+
+def test_check_slot_counts_pending_requests_only_when_asked(app):
+    monday = next_monday()
+    appointment_request = request_slot(monday, time(13))
+
+    assert check_slot(1, monday, time(13, 30)) == time(14, 30)
+    assert reason(1, monday, time(13, 30), include_requests=True) == 'booked'
+    assert check_slot(1, monday, time(13), include_requests=True,
+                      exclude_request_id=appointment_request.id) == time(14)
+
+
+def test_check_slot_follows_bookings_and_cancellations(app):
+    monday = next_monday()
+    check_slot(1, monday, time(15))
+    book(monday, time(15), time(16))
+    assert reason(1, monday, time(15)) == 'booked'
+
+    Appointment.query.filter_by(start_time=time(15)).update({'status': 'cancelled'})
+    db.session.commit()
+    assert check_slot(1, monday, time(15)) == time(16)
+
+
+def test_free_slots_skip_appointments_and_requests(app):
+    monday = next_monday()
+    book(monday, time(10), time(11))
+    book(monday, time(12))
+    request_slot(monday, time(14))
+
+    slots = free_slots(1, monday, monday + timedelta(days=1))
+
+    assert slots[monday] == [time(9), time(11), time(13), time(15), time(16)]
+    assert monday + timedelta(days=1) not in slots
+    assert free_slots(1, monday, monday, include_requests=False)[monday] == [time(9), time(11), time(13),
+                                                                              time(14), time(15), time(16)]
@@ -0,0 +1,237 @@
+import time
+from datetime import date, datetime, timedelta
+
+from cache import TTLCache, invalidate_on_commit
+from fragments import data_version
+from models import (
+    db, Appointment, CareerCounsellor, CareerGoal, Event, GoalMilestone, Notification, Student,
+    counsellor_stats, notification_states, student_dashboards
+)
+
+
+def notify(user_id, message='hello'):
+    db.session.add(Notification(user_id=user_id, user_type='student', message=message,
+                                notification_type='general'))
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(ttl=0.05)
+    cache.set('key', 1)
+    assert cache.get('key') == 1
+
+    time.sleep(0.1)
+    assert cache.get('key', 'missing') == 'missing'
+
+
+def test_set_refuses_values_computed_before_an_invalidation():
+    cache = TTLCache()
+    token = cache.generation('key')
+    cache.delete('key')
+
+    assert cache.set('key', 'stale', generation=token) is False
+    assert cache.get('key') is None
+    assert cache.set('key', 'fresh', generation=cache.generation('key')) is True
+    assert cache.get('key') == 'fresh'
+
+
+def test_clear_outdates_every_token():
+    cache = TTLCache()
+    token = cache.generation('key')
+    cache.clear()
+
+    assert cache.set('key', 'stale', generation=token) is False
+    assert cache.set('other', 'value') is True
+
+
+def test_get_or_set_does_not_store_a_value_invalidated_mid_compute():
+    cache = TTLCache()
+
+    def compute():
+        cache.delete('key')
+        return 'stale'
+
+    assert cache.get_or_set('key', compute) == 'stale'
+    assert cache.get('key') is None
+    assert cache.get_or_set('key', lambda: 'fresh') == 'fresh'
+    assert cache.get('key') == 'fresh'
+
+
+def test_full_cache_evicts_instead_of_growing():
+    cache = TTLCache(max_size=10)
+    for i in range(25):
+        cache.set(i, i)
+
+    assert len(cache._data) <= 10
+    assert cache.get(24) == 24
+
+
+def test_invalidation_waits_for_commit(app):
+    cache = TTLCache()
+    cache.set('key', 'value')
+
+    invalidate_on_commit(db.session, cache, 'key')
+    assert cache.get('key') == 'value'
+    db.session.commit()
+    assert cache.get('key') is None
+
+
+def test_invalidation_is_dropped_on_rollback(app):
+    cache = TTLCache()
+    cache.set('key', 'value')
+    notify(1)
+    db.session.flush()
+
+    invalidate_on_commit(db.session, cache, 'key')
+    db.session.rollback()
+    db.session.commit()
+    assert cache.get('key') == 'value'
+
+
+def test_unread_count_refreshes_after_commit(app):
+    assert Notification.unread_count('student', 1) == 0
+    notify(1)
+    db.session.flush()
+    assert Notification.unread_count('student', 1) == 0
+
+    db.session.commit()
+    assert Notification.unread_count('student', 1) == 1
+    assert notification_states.get(('student', 2)) is None
+
+    Notification.mark_all_read('student', 1)
+    db.session.commit()
+    assert Notification.unread_count('student', 1) == 0
+
+
+def test_unread_count_survives_a_rolled_back_notification(app):
+    assert Notification.unread_count('student', 1) == 0
+    notify(1)
+    db.session.flush()
+    db.session.rollback()
+
+    assert notification_states.get(('student', 1)) == (0, 0)
+
+
+def test_bulk_notification_changes_drop_cached_counts(app):
+    notify(1)
+    notify(2)
+    db.session.commit()
+    assert Notification.unread_count('student', 1) == Notification.unread_count('student', 2) == 1
+
+    Notification.query.filter_by(user_type='student', user_id=1).delete()
+    assert Notification.unread_count('student', 1) == 1
+    db.session.commit()
+
+    assert Notification.unread_count('student', 1) == 0
+    assert Notification.unread_count('student', 2) == 1
+
+
+def test_mark_all_read_keeps_other_users_counts_cached(app):
+    notify(1)
+    notify(2)
+    db.session.commit()
+    Notification.unread_count('student', 1)
+    Notification.unread_count('student', 2)
+
+    Notification.mark_all_read('student', 1)
+    db.session.commit()
+
+    assert notification_states.get(('student', 1)) is None
+    assert notification_states.get(('student', 2)) == (Notification.query.filter_by(user_id=2).one().notification_id, 1)
+
+
+def test_counsellor_stats_follow_appointments_and_reassignments(app):
+    assert CareerCounsellor.dashboard_stats(1)['total_students'] == 3
+    assert CareerCounsellor.dashboard_stats(2)['total_students'] == 0
+
+    db.session.add(Appointment(student_id=1, counsellor_id=1, appointment_date=date.today() + timedelta(days=1),
+                               start_time=datetime.now().time().replace(microsecond=0),
+                               appointment_type='Career', mode='online'))
+    db.session.commit()
+    assert CareerCounsellor.dashboard_stats(1)['upcoming_appointments'] == 1
+    assert counsellor_stats.get(2) is not None
+
+    db.session.get(Student, 1).counsellor_id = 2
+    db.session.commit()
+    assert CareerCounsellor.dashboard_stats(1)['total_students'] == 2
+    assert CareerCounsellor.dashboard_stats(2)['total_students'] == 1
+
+    Student.query.filter_by(counsellor_id=1).update({'counsellor_id': 2})
+    db.session.commit()
+    assert counsellor_stats.get(1) is None
+    assert CareerCounsellor.dashboard_stats(2)['total_students'] == 3
+
+
+def test_student_dashboards_are_dropped_per_student(app):
+    for student_id in (1, 2):
+        student_dashboards.set(student_id, 'cached')
+
+    goal = CareerGoal(student_id=1, title='Internship')
+    db.session.add(goal)
+    db.session.commit()
+    assert student_dashboards.get(1) is None
+    assert student_dashboards.get(2) == 'cached'
+
+    student_dashboards.set(1, 'cached')
+    db.session.add(GoalMilestone(goal_id=goal.goal_id, milestone_title='Apply'))
+    db.session.commit()
+    assert student_dashboards.get(1) is None
+    assert student_dashboards.get(2) == 'cached'
+
+
+def test_shared_changes_drop_every_student_dashboard(app):
+    for student_id in (1, 2):
+        student_dashboards.set(student_id, 'cached')
+
+    db.session.add(Event(title='Career fair', event_type='seminar', event_date=date.today() + timedelta(days=3),
+                         start_time=datetime.now().time().replace(microsecond=0)))
+    db.session.commit()
+
+    assert student_dashboards.get(1) is None
+    assert student_dashboards.get(2) is None
+
+
+def test_dashboard_is_recached_after_a_change(app, login):
+    client = login('s0@example.com')
+    assert client.get('/student/dashboard').status_code == 200
+    assert student_dashboards.get(1) is not None
+
+    db.session.add(CareerGoal(student_id=1, title='Scholarship'))
+    db.session.commit()
+    assert student_dashboards.get(1) is None
+    assert client.get('/student/dashboard').status_code == 200
+    assert student_dashboards.get(1) is not None
+
+
+def test_fragments_are_cached_per_key(app):
+    renders = []
+    template = app.jinja_env.from_string(
+        "{% cache 'greeting', user_id, version %}{{ record(user_id) }}Hello {{ name }}{% endcache %}"
+    )
+
+    def render(user_id, name, version=1):
+        return template.render(user_id=user_id, name=name, version=version, record=lambda u: renders.append(u) or '')
+
+    assert render(1, 'Ann') == 'Hello Ann'
+    assert render(2, 'Bob') == 'Hello Bob'
+    assert render(1, 'Changed') == 'Hello Ann'
+    assert render(1, 'Changed', version=2) == 'Hello Changed'
+    assert renders == [1, 2, 1]
+
+
+def test_data_version_follows_column_values(app):
+    goals = [CareerGoal(goal_id=1, student_id=1, title='Internship')]
+    before = data_version(goals)
+
+    assert data_version([CareerGoal(goal_id=1, student_id=1, title='Internship')]) == before
+    goals[0].title = 'Scholarship'
+    assert data_version(goals) != before
+    assert data_version(goals, []) != data_version([], goals)
+
+
+def test_student_dashboards_do_not_share_fragments(app, login):
+    first = login('s0@example.com').get('/student/dashboard').get_data(as_text=True)
+    second = login('s1@example.com').get('/student/dashboard').get_data(as_text=True)
+
+    # The cached scripts fragment embeds the student's id.
+    assert 'const currentUserId = 1;' in first
+    assert 'const currentUserId = 2;' in second
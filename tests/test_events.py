@@ -0,0 +1,68 @@
+from datetime import date, time, timedelta
+
+import pytest
+from sqlalchemy import event as sa_event
+
+from models import db, Event, EventRegistration
+
+
+@pytest.fixture
+def events(app):
+    """An upcoming event whose two places are taken by students 2 and 3, and one nobody registered for."""
+    upcoming = date.today() + timedelta(days=7)
+    popular = Event(title='Careers in data', event_type='webinar', event_date=upcoming, start_time=time(10),
+                    capacity=2)
+    quiet = Event(title='CV clinic', event_type='workshop', event_date=upcoming, start_time=time(14))
+    db.session.add_all([popular, quiet])
+    db.session.flush()
+    db.session.add_all([EventRegistration(event_id=popular.event_id, student_id=student_id) for student_id in (2, 3)])
+    db.session.commit()
+    return popular.event_id, quiet.event_id
+
+
+@pytest.fixture
+def statements(app):
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    sa_event.listen(db.engine, 'before_cursor_execute', record)
+    yield recorded
+    sa_event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_registered_count_is_loaded_with_the_events_when_undeferred(events, statements):
+    db.session.expire_all()
+    loaded = Event.query.options(db.undefer(Event.registered_count)).order_by(Event.event_id).all()
+
+    assert [e.registered_count for e in loaded] == [2, 0]
+    assert len(statements) == 1
+
+
+def test_registered_count_stays_deferred_by_default(events, statements):
+    db.session.expire_all()
+    loaded = Event.query.order_by(Event.event_id).all()
+
+    assert 'event_registrations' not in statements[0]
+    assert loaded[0].registered_count == 2
+    assert len(statements) == 2
+
+
+def test_student_events_report_counts_and_registration(events, login):
+    client = login('s0@example.com')
+
+    listed = {e['event_id']: e for e in client.get('/student/events').get_json()['events']}
+
+    assert listed[events[0]]['registered_count'] == 2
+    assert listed[events[1]]['registered_count'] == 0
+    assert not listed[events[0]]['registration']
+
+
+def test_registration_stops_at_capacity(events, login):
+    client = login('s0@example.com')
+
+    response = client.post(f'/student/events/{events[0]}/register')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Event is at full capacity'
+    assert client.post(f'/student/events/{events[1]}/register').status_code == 201
@@ -0,0 +1,198 @@
+import json
+import time
+
+import pytest
+from flask_login import login_user
+from simple_websocket import ConnectionClosed
+
+from gateway import chat_gateway, load_contacts
+from models import db, Administrator, CareerCounsellor, Message, Student
+from realtime import MessageHub, PresenceStore, message_hub, presence
+
+
+class FakeWebSocket:
+    """Feeds chat_gateway a fixed list of frames, then reports the peer gone."""
+
+    def __init__(self, *frames):
+        self.incoming = [frame if isinstance(frame, str) else json.dumps(frame) for frame in frames]
+        self.sent = []
+        self.closed = None
+
+    def receive(self):
+        if not self.incoming:
+            raise ConnectionClosed()
+        return self.incoming.pop(0)
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def close(self, reason=None, message=None):
+        self.closed = (reason, message)
+
+    def wait_for(self, count, timeout=2):
+        """Frames go out on the gateway's writer thread; wait until count have arrived."""
+        deadline = time.monotonic() + timeout
+        while len(self.sent) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.sent
+
+
+def run_gateway(app, user, *frames):
+    ws = FakeWebSocket(*frames)
+    with app.test_request_context('/ws/chat'):
+        if user is not None:
+            login_user(user)
+        if user is None or isinstance(user, Administrator):
+            chat_gateway(ws)
+        else:
+            with pytest.raises(ConnectionClosed):
+                chat_gateway(ws)
+    return ws
+
+
+def drain(q):
+    events = []
+    while not q.empty():
+        events.append(q.get_nowait())
+    return events
+
+
+def test_hub_delivers_to_every_subscriber_of_a_user():
+    hub = MessageHub()
+    first, second = hub.subscribe('student', 1), hub.subscribe('student', '1')
+    other = hub.subscribe('student', 2)
+
+    assert hub.publish('student', 1, 'typing', {'typing': True}) == 2
+    assert drain(first) == drain(second) == [('typing', {'typing': True})]
+    assert drain(other) == []
+    assert hub.publish('counsellor', 1, 'typing', {}) == 0
+
+
+def test_hub_drops_events_for_a_full_queue():
+    hub = MessageHub(max_queue_size=1)
+    q = hub.subscribe('counsellor', 1)
+
+    hub.publish('counsellor', 1, 'message', {'id': 1})
+    hub.publish('counsellor', 1, 'message', {'id': 2})
+
+    assert drain(q) == [('message', {'id': 1})]
+
+
+def test_hub_unsubscribe_removes_only_that_queue():
+    hub = MessageHub()
+    first, second = hub.subscribe('student', 1), hub.subscribe('student', 1)
+
+    hub.unsubscribe('student', 1, first)
+    assert hub.subscriber_count('student', 1) == 1
+    hub.unsubscribe('student', 1, second)
+    assert hub.subscriber_count('student', 1) == 0
+    hub.unsubscribe('student', 1, second)
+
+
+def test_presence_touch_reports_coming_online_once():
+    store = PresenceStore(ttl=45)
+
+    assert store.touch('student', 1) is True
+    assert store.touch('student', '1') is False
+    assert store.is_online('student', 1)
+    assert store.online_among('student', [1, 2]) == {1}
+
+    store.forget('student', 1)
+    assert not store.is_online('student', 1)
+    assert store.touch('student', 1) is True
+
+
+def test_presence_entries_expire_after_ttl():
+    store = PresenceStore(ttl=0.05)
+    store.touch('counsellor', 3)
+    time.sleep(0.1)
+
+    assert not store.is_online('counsellor', 3)
+    assert store.online_among('counsellor', [3]) == set()
+    assert store.touch('counsellor', 3) is True
+
+
+def test_load_contacts(app):
+    assert load_contacts('student', 1) == {('counsellor', 1)}
+    assert load_contacts('counsellor', 1) == {('student', 1), ('student', 2), ('student', 3)}
+    assert load_contacts('counsellor', 2) == set()
+
+    db.session.get(Student, 1).counsellor_id = None
+    db.session.commit()
+    assert load_contacts('student', 1) == set()
+
+
+def test_gateway_rejects_anonymous_users(app):
+    ws = run_gateway(app, None)
+
+    assert ws.closed[0] == 1008
+    assert message_hub.subscriber_count('student', 1) == 0
+
+
+def test_gateway_rejects_administrators(app):
+    ws = run_gateway(app, Administrator.query.first())
+
+    assert ws.closed[0] == 1008
+    assert ws.sent == []
+
+
+def test_gateway_announces_presence_to_contacts_only(app):
+    counsellor_queue = message_hub.subscribe('counsellor', 1)
+    other_queue = message_hub.subscribe('counsellor', 2)
+    presence.touch('counsellor', 1)
+
+    ws = run_gateway(app, db.session.get(Student, 1))
+
+    ready = ws.wait_for(1)[0]
+    assert ready['event'] == 'ready'
+    assert ready['data']['online'] == [{'user_type': 'counsellor', 'user_id': 1}]
+    assert [event for event, _ in drain(counsellor_queue)] == ['presence', 'presence']
+    assert drain(other_queue) == []
+    assert not presence.is_online('student', 1)
+
+
+def test_gateway_rejects_frames_for_other_counsellors(app):
+    other_queue = message_hub.subscribe('counsellor', 2)
+
+    ws = run_gateway(
+        app, db.session.get(Student, 1),
+        {'type': 'typing', 'partner_type': 'counsellor', 'partner_id': 2},
+        {'type': 'read', 'partner_type': 'counsellor', 'partner_id': 2, 'up_to': 10},
+        {'type': 'send', 'recipient_type': 'counsellor', 'recipient_id': 2, 'message': 'hi'}
+    )
+
+    errors = [sent['data']['error'] for sent in ws.wait_for(4)[1:]]
+    assert errors == ['You can only message your assigned contacts'] * 3
+    assert drain(other_queue) == []
+    assert Message.query.count() == 0
+
+
+def test_gateway_rejects_other_counsellors_students(app):
+    ws = run_gateway(
+        app, db.session.get(CareerCounsellor, 2),
+        {'type': 'send', 'recipient_type': 'student', 'recipient_id': 1, 'message': 'hi'}
+    )
+
+    assert ws.wait_for(2)[1]['data']['error'] == 'You can only message your assigned contacts'
+    assert Message.query.count() == 0
+
+
+def test_gateway_relays_frames_to_contacts(app):
+    counsellor_queue = message_hub.subscribe('counsellor', 1)
+
+    ws = run_gateway(
+        app, db.session.get(Student, 1),
+        {'type': 'typing', 'partner_type': 'counsellor', 'partner_id': 1},
+        {'type': 'send', 'recipient_type': 'counsellor', 'recipient_id': 1, 'message': 'hello'},
+        {'type': 'read', 'partner_type': 'counsellor', 'partner_id': 1, 'up_to': 'all'},
+        'not json'
+    )
+
+    events = [event for event, _ in drain(counsellor_queue)]
+    assert events == ['presence', 'typing', 'message', 'presence']
+    message = Message.query.one()
+    assert (message.sender_type, message.sender_id, message.recipient_id) == ('student', 1, 1)
+
+    sent = ws.wait_for(4)
+    assert [frame['event'] for frame in sent] == ['ready', 'message', 'error', 'error']
+
@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from jobs import archive_messages
+from models import db, Conversation, Message, MessageArchive
+from realtime import message_hub
+from routes.messages import encode_cursor
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+# (sender, age) for messages 1-7 between student 1 and counsellor 1. Messages
+# 1-2 and 4-5 share a timestamp; 1-3 are old enough to be archived.
+THREAD = [
+    ('counsellor', timedelta(days=400)),
+    ('student', timedelta(days=400)),
+    ('counsellor', timedelta(days=300)),
+    ('student', timedelta(hours=2)),
+    ('counsellor', timedelta(hours=2)),
+    ('student', timedelta(hours=1)),
+    ('counsellor', timedelta(minutes=5)),
+]
+
+
+def store(sender_type, sent_at, student_id=1):
+    recipient_type = 'counsellor' if sender_type == 'student' else 'student'
+    ids = {'student': student_id, 'counsellor': 1}
+    message = Message(sender_type=sender_type, sender_id=ids[sender_type], recipient_type=recipient_type,
+                      recipient_id=ids[recipient_type], message_text=f'{sender_type} at {sent_at}',
+                      sent_at=sent_at, is_read=False)
+    db.session.add(message)
+    db.session.flush()
+    Conversation.record_message(message)
+    db.session.commit()
+    return message
+
+
+@pytest.fixture
+def thread(app):
+    ids = [store(sender_type, NOW - age).message_id for sender_type, age in THREAD]
+    assert archive_messages(max_age_days=180) == 3
+    return ids
+
+
+@pytest.fixture
+def archive_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'messages_archive' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def page(client, **params):
+    response = client.get('/api/messages/conversation/counsellor/1', query_string=params)
+    assert response.status_code == 200
+    return ([m['message_id'] for m in response.get_json()], response.headers['X-Has-More'] == 'true',
+            response.headers.get('X-Before-Cursor'), response.headers.get('X-After-Cursor'))
+
+
+def test_archive_moves_old_messages_as_read(thread):
+    assert [m.message_id for m in MessageArchive.query.order_by(MessageArchive.message_id)] == thread[:3]
+    assert all(m.is_read for m in MessageArchive.query)
+    assert Message.query.count() == 4
+
+    conversation = db.session.get(Conversation, (1, 1))
+    assert conversation.student_unread == 2
+    assert conversation.counsellor_unread == 2
+    assert conversation.archived_at == NOW - timedelta(days=300)
+
+
+def test_paging_back_crosses_into_the_archive(thread, login):
+    client = login('s0@example.com')
+
+    ids, has_more, before, _ = page(client, limit=3)
+    assert ids == thread[4:] and has_more
+    ids, has_more, before, _ = page(client, limit=3, before=before)
+    assert ids == thread[1:4] and has_more
+    ids, has_more, _, _ = page(client, limit=3, before=before)
+    assert ids == thread[:1] and not has_more
+
+
+def test_paging_forward_leaves_the_archive(thread, login):
+    client = login('s0@example.com')
+    oldest = MessageArchive.query.order_by(MessageArchive.sent_at, MessageArchive.message_id).first()
+
+    ids, has_more, _, after = page(client, limit=3, after=encode_cursor(oldest))
+    assert ids == thread[1:4] and has_more
+    ids, has_more, _, after = page(client, limit=3, after=after)
+    assert ids == thread[4:] and not has_more
+    ids, has_more, _, _ = page(client, limit=3, after=after)
+    assert ids == [] and not has_more
+
+
+def test_forward_paging_from_the_hot_table_skips_the_archive(thread, login, archive_queries):
+    client = login('s0@example.com')
+    cursor = encode_cursor(db.session.get(Message, thread[3]))
+
+    ids, _, _, _ = page(client, after=cursor)
+    assert ids == thread[4:]
+    assert archive_queries == []
+
+
+def test_threads_without_archived_messages_never_read_the_archive(app, login, archive_queries):
+    ids = [store('student', NOW - timedelta(minutes=i), student_id=2).message_id for i in range(3, 0, -1)]
+    client = login('s1@example.com')
+
+    assert page(client, limit=2)[:2] == (ids[1:], True)
+    assert page(client, limit=2, before=page(client, limit=2)[2])[:2] == (ids[:1], False)
+    assert archive_queries == []
+
+
+def test_opening_an_older_page_leaves_newer_messages_unread(thread, login):
+    client = login('s0@example.com')
+
+    ids = page(client, limit=1, before=encode_cursor(db.session.get(Message, thread[5])))[0]
+    assert ids == thread[4:5]
+    db.session.expire_all()
+    assert db.session.get(Message, thread[4]).is_read is True
+    assert db.session.get(Message, thread[6]).is_read is False
+    assert db.session.get(Conversation, (1, 1)).student_unread == 1
+
+
+@pytest.mark.parametrize('cursor', ['garbage', '2024-01-01T00:00:00.000000_x', '_1'])
+def test_malformed_cursors_are_rejected(app, login, cursor):
+    client = login('s0@example.com')
+
+    assert client.get('/api/messages/conversation/counsellor/1', query_string={'before': cursor}).status_code == 400
+    assert client.get('/student/messages', query_string={'after': cursor}).status_code == 400
+
+
+def test_student_messages_go_through_the_conversation(app, login):
+    counsellor_queue = message_hub.subscribe('counsellor', 1)
+    client = login('s0@example.com')
+
+    response = client.post('/student/messages', json={'message_text': 'Can we meet?'})
+
+    assert response.status_code == 201
+    message_id = response.get_json()['data']['id']
+    conversation = db.session.get(Conversation, (1, 1))
+    assert (conversation.last_message_id, conversation.counsellor_unread) == (message_id, 1)
+    assert counsellor_queue.get_nowait()[1]['message_id'] == message_id
+    assert datetime.utcnow() - db.session.get(Message, message_id).sent_at < timedelta(minutes=1)
+
+    messages = client.get('/student/messages').get_json()['messages']
+    assert [m['id'] for m in messages] == [message_id]
+
+
+def test_administrators_cannot_use_chat(thread, login):
+    # The seeded administrator has id 1, like the counsellor in the thread.
+    client = login('admin@example.com')
+
+    assert client.get('/api/messages/stream').status_code == 403
+    assert client.get('/api/messages/conversations').status_code == 403
+    assert client.get('/api/messages/conversation/student/1').status_code == 403
+    response = client.post('/api/messages/send', json={'recipient_type': 'student', 'recipient_id': 1,
+                                                        'message': 'hello'})
+    assert response.status_code == 403
+    assert message_hub._subscribers == {}
+    assert Message.query.count() == 4
+
+
+def test_administrators_cannot_poll_counsellor_threads(thread, login):
+    client = login('admin@example.com')
+
+    assert client.get('/api/messages/conversation/student/1/new').status_code == 403
+    assert client.get('/api/check-all-new-messages').status_code == 403
+
+
+def test_administrators_cannot_mark_threads_read(thread, login):
+    client = login('admin@example.com')
+
+    response = client.post('/api/messages/conversation/student/1/read', json={'up_to': thread[-1]})
+
+    assert response.status_code == 403
+    assert db.session.get(Conversation, (1, 1)).counsellor_unread == 2
+
+
+def test_conversation_rows_are_upserted_in_one_statement(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'conversations' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        store('student', NOW - timedelta(minutes=1), student_id=2)
+        third = store('counsellor', NOW, student_id=2)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 2
+    assert all(statement.startswith('INSERT') and 'ON CONFLICT' in statement for statement in statements)
+    conversation = db.session.get(Conversation, (2, 1))
+    assert conversation.last_message_id == third.message_id
+    assert (conversation.student_unread, conversation.counsellor_unread) == (1, 1)
+
+
+def test_administrators_cannot_search_messages(thread, login):
+    client = login('admin@example.com')
+
+    assert client.get('/api/messages/search', query_string={'q': 'counsellor'}).status_code == 403
+
+
+def test_broadcast_reaches_each_assigned_student_once(thread, login):
+    counsellor_queue = message_hub.subscribe('counsellor', 1)
+    student_queue = message_hub.subscribe('student', 2)
+    client = login('c1@example.com')
+
+    response = client.post('/api/messages/broadcast', json={'message': 'Office hours moved'})
+
+    assert response.get_json() == {'success': True, 'recipients': 3}
+    messages = Message.query.filter_by(message_text='Office hours moved').order_by(Message.recipient_id).all()
+    assert [m.recipient_id for m in messages] == [1, 2, 3]
+    event, payload = counsellor_queue.get_nowait()
+    assert event == 'broadcast'
+    assert sorted(m['message_id'] for m in payload['messages']) == [m.message_id for m in messages]
+    assert student_queue.get_nowait()[1]['message_id'] == messages[1].message_id
+
+    conversations = {c.student_id: c for c in Conversation.query.filter_by(counsellor_id=1)}
+    assert {student_id: c.last_message_id for student_id, c in conversations.items()} == {
+        m.recipient_id: m.message_id for m in messages
+    }
+    assert conversations[1].student_unread == 3
+    assert conversations[2].student_unread == conversations[3].student_unread == 1
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from jobs import compact_notifications
+from models import db, Notification, NotificationOutbox, Student, notification_states
+
+
+def test_fan_out_copies_a_select_of_recipients_server_side(app):
+    assert Notification.unread_count('student', 1) == 0
+    recipients = db.select(Student.id).where(Student.counsellor_id == 1)
+
+    inserted = Notification.fan_out('student', recipients, 'Your counsellor has changed', 'general', 2)
+    db.session.commit()
+
+    assert inserted == 3
+    rows = Notification.query.order_by(Notification.user_id).all()
+    assert [(n.user_type, n.user_id, n.related_entity_id, n.read_status) for n in rows] == [
+        ('student', 1, 2, False), ('student', 2, 2, False), ('student', 3, 2, False)
+    ]
+    assert notification_states.get(('student', 1)) is None
+    assert Notification.unread_count('student', 1) == 1
+
+
+def test_fan_out_of_an_empty_select_inserts_nothing(app):
+    recipients = db.select(Student.id).where(Student.counsellor_id == 2)
+
+    assert Notification.fan_out('student', recipients, 'Nobody', 'general') == 0
+    assert Notification.fan_out('student', [], 'Nobody', 'general') == 0
+    assert Notification.query.count() == 0
+
+
+def feed(client, **params):
+    response = client.get('/api/notifications/feed', query_string=params)
+    assert response.status_code == 200
+    data = response.get_json()
+    return [n['id'] for n in data['notifications']], data
+
+
+def test_feed_pages_across_a_shared_timestamp(app, login):
+    # Notifications 2-4 share a timestamp, so the page boundary falls inside a tie.
+    now = datetime.now().replace(microsecond=0)
+    times = [now - timedelta(hours=2), now - timedelta(hours=1), now - timedelta(hours=1), now - timedelta(hours=1), now]
+    for created_at in times:
+        db.session.add(Notification(user_id=1, user_type='student', message=f'at {created_at}',
+                                    notification_type='general', created_at=created_at))
+    db.session.add(Notification(user_id=2, user_type='student', message='someone else', notification_type='general'))
+    db.session.commit()
+    client = login('s0@example.com')
+
+    ids, first = feed(client, limit=2)
+    assert ids == [5, 4] and first['has_older']
+    ids, second = feed(client, limit=2, before=first['before_cursor'])
+    assert ids == [3, 2] and second['has_older'] and second['has_newer']
+    ids, third = feed(client, limit=2, before=second['before_cursor'])
+    assert ids == [1] and not third['has_older']
+
+    ids, newer = feed(client, limit=2, after=third['after_cursor'])
+    assert ids == [3, 2] and newer['has_newer']
+    ids, newest = feed(client, limit=2, after=newer['after_cursor'])
+    assert ids == [5, 4] and not newest['has_newer']
+
+
+def test_notification_etag_sees_other_workers_commits(app, login):
+    client = login('s0@example.com')
+    first = client.get('/api/notifications')
+    assert first.status_code == 200 and first.get_json() == []
+    assert client.get('/api/notifications', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # Written behind this worker's back, so its cached inbox state is now stale.
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(db.insert(Notification).values(user_id=1, user_type='student', message='From elsewhere',
+                                                          notification_type='general', read_status=False,
+                                                          created_at=datetime.now()))
+
+    response = client.get('/api/notifications', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert [n['message'] for n in response.get_json()] == ['From elsewhere']
+
+
+def old_notification(read, related_entity_id=None, notification_type='appointment', days=40, user_id=1):
+    db.session.add(Notification(user_id=user_id, user_type='student', message='Appointment update',
+                                notification_type=notification_type, read_status=read,
+                                related_entity_id=related_entity_id,
+                                created_at=datetime.now() - timedelta(days=days)))
+
+
+def test_compaction_collapses_only_read_notifications(app):
+    for _ in range(5):
+        old_notification(read=True, related_entity_id=7)
+    old_notification(read=False, related_entity_id=8)
+    old_notification(read=False, related_entity_id=9)
+    for entity_id in range(5):
+        old_notification(read=True, related_entity_id=entity_id, notification_type='event')
+    db.session.commit()
+
+    report = compact_notifications(retention_days=90, collapse_after_days=30)
+
+    assert (report['collapsed'], report['summaries']) == (10, 2)
+    unread = Notification.query.filter_by(read_status=False).order_by(Notification.related_entity_id).all()
+    assert [n.related_entity_id for n in unread] == [8, 9]
+    summaries = {n.notification_type: n for n in Notification.query.filter(Notification.collapsed_count.isnot(None))}
+    assert summaries['appointment'].collapsed_count == 5 and summaries['appointment'].read_status
+    assert summaries['appointment'].related_entity_id == 7
+    assert summaries['event'].related_entity_id is None
+    assert Notification.unread_count('student', 1) == 2
+
+
+def test_compaction_folds_summaries_into_later_summaries(app):
+    for _ in range(5):
+        old_notification(read=True)
+    db.session.commit()
+    compact_notifications(retention_days=90, collapse_after_days=30)
+    for _ in range(4):
+        old_notification(read=True, days=35)
+    db.session.commit()
+
+    compact_notifications(retention_days=90, collapse_after_days=30)
+
+    assert [n.collapsed_count for n in Notification.query] == [9]
+
+
+def test_compaction_purges_by_each_tables_clock(app):
+    old_notification(read=True, days=91, notification_type='general')
+    old_notification(read=False, days=91, notification_type='general')
+    db.session.add(NotificationOutbox(event_type='appointment_requested', payload='{}', status='done',
+                                      processed_at=datetime.utcnow() - timedelta(days=91)))
+    db.session.add(NotificationOutbox(event_type='appointment_requested', payload='{}', status='done',
+                                      processed_at=datetime.utcnow() - timedelta(days=89)))
+    db.session.commit()
+
+    report = compact_notifications(retention_days=90, collapse_after_days=30)
+
+    assert (report['purged'], report['outbox_purged']) == (1, 1)
+    assert Notification.query.one().read_status is False
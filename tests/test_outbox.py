@@ -0,0 +1,135 @@
+from datetime import date, datetime, time, timedelta
+
+import outbox
+from models import db, AppointmentRequest, Notification, NotificationOutbox
+from outbox import OutboxDispatcher, claim_batch, drain_outbox, process_entry, start_outbox
+
+
+def enqueue_request():
+    appointment_request = AppointmentRequest(student_id=1, counsellor_id=1, preferred_date=date(2030, 1, 7),
+                                             preferred_time=time(10), appointment_type='Career', mode='online')
+    db.session.add(appointment_request)
+    db.session.flush()
+    entry = NotificationOutbox.enqueue('appointment_requested', request_id=appointment_request.id)
+    db.session.commit()
+    return entry.outbox_id
+
+
+def entry(outbox_id):
+    db.session.expire_all()
+    return db.session.get(NotificationOutbox, outbox_id)
+
+
+def test_claim_takes_each_pending_entry_once(app):
+    first, second = enqueue_request(), enqueue_request()
+
+    assert claim_batch(1, 300) == [first]
+    assert claim_batch(10, 300) == [second]
+    assert claim_batch(10, 300) == []
+    assert (entry(first).status, entry(first).attempts) == ('processing', 1)
+
+
+def test_claim_takes_over_stale_claims(app):
+    outbox_id = enqueue_request()
+    claim_batch(10, 300)
+    token = entry(outbox_id).claim_token
+
+    entry(outbox_id).claimed_at = datetime.utcnow() - timedelta(seconds=301)
+    db.session.commit()
+
+    assert claim_batch(10, 300) == [outbox_id]
+    assert entry(outbox_id).claim_token != token
+    assert entry(outbox_id).attempts == 2
+
+
+def test_claim_skips_entries_waiting_to_retry(app):
+    outbox_id = enqueue_request()
+    entry(outbox_id).available_at = datetime.utcnow() + timedelta(minutes=1)
+    db.session.commit()
+
+    assert claim_batch(10, 300) == []
+
+    entry(outbox_id).available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert claim_batch(10, 300) == [outbox_id]
+
+
+def test_process_entry_stores_notifications_and_marks_done(app):
+    outbox_id = enqueue_request()
+    claim_batch(10, 300)
+
+    assert process_entry(outbox_id) is True
+
+    assert entry(outbox_id).status == 'done'
+    assert {(n.user_type, n.user_id) for n in Notification.query} == {('counsellor', 1), ('student', 1)}
+
+
+def test_failed_entry_backs_off_then_gives_up(app):
+    pending = NotificationOutbox.enqueue('no_such_event')
+    db.session.commit()
+    outbox_id = pending.outbox_id
+
+    claim_batch(10, 300)
+    before = datetime.utcnow()
+    assert process_entry(outbox_id, max_attempts=2, retry_delay=30) is False
+    failed = entry(outbox_id)
+    assert failed.status == 'pending'
+    assert 'no_such_event' in failed.last_error
+    assert before + timedelta(seconds=29) < failed.available_at < before + timedelta(seconds=31)
+    assert claim_batch(10, 300) == []
+
+    failed.available_at = None
+    db.session.commit()
+    claim_batch(10, 300)
+    before = datetime.utcnow()
+    assert process_entry(outbox_id, max_attempts=2, retry_delay=30) is False
+    assert entry(outbox_id).status == 'failed'
+    assert entry(outbox_id).available_at > before + timedelta(seconds=59)
+    assert Notification.query.count() == 0
+
+
+def test_drain_outbox_handles_every_entry(app):
+    ids = [enqueue_request() for _ in range(3)]
+    app.config['OUTBOX_BATCH_SIZE'] = 2
+    try:
+        assert drain_outbox() == 3
+    finally:
+        app.config['OUTBOX_BATCH_SIZE'] = 50
+
+    assert {entry(outbox_id).status for outbox_id in ids} == {'done'}
+    assert Notification.query.count() == 6
+
+
+def test_dispatcher_processes_a_batch_on_its_pool(app):
+    ids = [enqueue_request() for _ in range(3)]
+    dispatcher = OutboxDispatcher(app)
+    try:
+        assert dispatcher.run_once() == 3
+    finally:
+        dispatcher.executor.shutdown(wait=True)
+
+    assert {entry(outbox_id).status for outbox_id in ids} == {'done'}
+    assert Notification.query.count() == 6
+
+
+def test_first_request_starts_one_dispatcher(app, client):
+    app.config['OUTBOX_DISPATCHER_ENABLED'] = True
+    try:
+        client.get('/')
+        started = outbox.dispatcher
+        client.get('/')
+
+        assert started is not None and started._thread.is_alive()
+        assert outbox.dispatcher is started
+        assert start_outbox(app) is started
+    finally:
+        if outbox.dispatcher is not None:
+            outbox.dispatcher.stop()
+        outbox.dispatcher = None
+
+
+def test_disabled_dispatcher_is_never_started(app, client):
+    client.get('/')
+
+    assert start_outbox(app) is None
+    assert outbox.dispatcher is None